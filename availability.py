@@ -0,0 +1,145 @@
+"""
+Server-side availability engine.
+
+Implements the same rules as the frontend's
+`availabilityUtils.generateAvailability`, but instead of testing every
+15-minute slot against every booking it expands the bookings that can touch
+the requested range, merges them into sorted busy intervals and sweeps the
+gaps once.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Iterator, List, Tuple
+
+# Scheduling rules (kept in sync with availabilityUtils.js)
+WORKING_HOURS = (9, 18)                   # 9:00 AM to 6:00 PM
+SLOT_INTERVAL = timedelta(minutes=15)     # 15-minute slots
+SESSION_DURATION = timedelta(minutes=60)  # 60-minute sessions
+MIN_GAP = SESSION_DURATION                # minimum gap around a booking
+RECURRENCE_STEP = timedelta(weeks=1)      # recurring bookings are weekly
+
+Interval = Tuple[datetime, datetime]
+
+
+def week_key(dt: datetime) -> date:
+    """
+    Identify the (Sunday-based) week a datetime falls in.
+
+    Two datetimes are in the same week when their keys are equal. This
+    follows the frontend's year/week-number comparison for exceptions except
+    at its edges: getWeekNumber() counts the time of day, so it moves
+    Saturdays after midnight into the next week, and it restarts every
+    January.
+    """
+    d = dt.date()
+    return d - timedelta(days=(d.weekday() + 1) % 7)
+
+
+def series_occurrences(booking, start: datetime, end: datetime) -> Iterator[datetime]:
+    """
+    Yield the regular session start times of `booking` in [start, end).
+
+    Recurring bookings repeat weekly from their first `date_time`, skipping
+    any week that has an exception; a one-off booking has a single session.
+    """
+    if not booking.is_recurring:
+        if start <= booking.date_time < end:
+            yield booking.date_time
+        return
+
+    skipped_weeks = {week_key(dt) for dt in booking.exception_dates}
+    first = booking.date_time
+    # Jump straight to the first occurrence inside the range
+    # instead of walking the series from its beginning.
+    steps = 0
+    if first < start:
+        steps = -(-(start - first) // RECURRENCE_STEP)
+    occurrence = first + steps * RECURRENCE_STEP
+    while occurrence < end:
+        if week_key(occurrence) not in skipped_weeks:
+            yield occurrence
+        occurrence += RECURRENCE_STEP
+
+
+def expand_booking(booking, start: datetime, end: datetime) -> Iterator[datetime]:
+    """
+    Yield every session start time of `booking` in [start, end).
+
+    Exception datetimes are the rescheduled sessions themselves, so they are
+    yielded alongside the regular series.
+    """
+    yield from series_occurrences(booking, start, end)
+    for dt in booking.exception_dates:
+        if start <= dt < end:
+            yield dt
+
+
+def busy_intervals(sessions: Iterable[datetime]) -> List[Interval]:
+    """
+    Build the sorted, merged list of blocked intervals for `sessions`.
+
+    Each session blocks its own hour plus `MIN_GAP` on either side, so a
+    slot is free exactly when it does not overlap any blocked interval.
+    """
+    intervals = sorted(
+        (session - MIN_GAP, session + SESSION_DURATION + MIN_GAP)
+        for session in sessions
+    )
+
+    merged: List[Interval] = []
+    for lo, hi in intervals:
+        if merged and lo <= merged[-1][1]:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def lookup_range(start_day: date, end_day: date) -> Interval:
+    """
+    The span of session start times that can affect slots from `start_day`
+    to `end_day` inclusive.
+    """
+    pad = SESSION_DURATION + MIN_GAP
+    return (
+        datetime.combine(start_day, time()) - pad,
+        datetime.combine(end_day + timedelta(days=1), time()) + pad,
+    )
+
+
+def free_slots(sessions: Iterable[datetime], start_day: date, end_day: date) -> List[Interval]:
+    """
+    Return the free (start, end) session slots from `start_day` to `end_day`
+    inclusive, within working hours.
+
+    `sessions` are the booked session start times; anything outside
+    `lookup_range(start_day, end_day)` is irrelevant and may be omitted.
+    """
+    busy = busy_intervals(sessions)
+
+    slots: List[Interval] = []
+    i = 0
+    day = start_day
+    while day <= end_day:
+        window_start = datetime.combine(day, time(WORKING_HOURS[0]))
+        window_end = datetime.combine(day, time(WORKING_HOURS[1]))
+
+        # Busy intervals are sorted, so skip the ones that ended before today.
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+
+        cursor = window_start
+        j = i
+        while cursor + SESSION_DURATION <= window_end:
+            if j < len(busy) and busy[j][0] < cursor + SESSION_DURATION:
+                # The slot would overlap busy[j]; move past it, back onto the grid.
+                if busy[j][1] > cursor:
+                    offset = busy[j][1] - window_start
+                    cursor = window_start + -(-offset // SLOT_INTERVAL) * SLOT_INTERVAL
+                j += 1
+                continue
+            slots.append((cursor, cursor + SESSION_DURATION))
+            cursor += SLOT_INTERVAL
+
+        day += timedelta(days=1)
+    return slots
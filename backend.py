@@ -1,4 +1,3 @@
-import json
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import String
@@ -14,7 +13,7 @@ from sqlalchemy import select
 
 
 from flask_marshmallow import Marshmallow
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask_cors import CORS
 from sqlalchemy.dialects.postgresql import JSON
 
@@ -71,8 +70,13 @@ booking_schema = BookingSchema()
 bookings_schema = BookingSchema(many=True)
 
 
-import os, redis
-r = redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
+import uuid
+
+from utils.jobs import ACCEPTED, DONE, FAILED, JobStore
+from utils.redis_clients import redis_client
+from utils.timestamps import parse_client_time
+r = redis_client
+jobs = JobStore(r)
 
 from tasks.reporting import generate_report
 
@@ -82,30 +86,33 @@ def create_report():
     if not idem_key:
         return jsonify({"error": "Missing Idempotency-Key"}), 400
 
-    done = r.get(f"done:{idem_key}")
-    if done:
-        return jsonify(json.loads(done))
-
-    # Atomic set: only allow one inflight per key
-    ok = r.set(f"inflight:{idem_key}", "1", nx=True, ex=3600)
-    if not ok:
-        return jsonify({"status": "inflight", "poll": f"/jobs/{idem_key}"}), 202
+    # Same job hash as the FastAPI app (utils/jobs.py): return the finished
+    # result, report a job in progress, or claim the key for our task.
+    task_id = str(uuid.uuid4())
+    job = jobs.claim(idem_key, task_id)
+    if job is not None and job.state == DONE:
+        return app.response_class(job.result, mimetype="application/json")
+    if job is not None:
+        return jsonify({"status": job.state, "poll": f"/jobs/{idem_key}"}), 202
 
-    async_res = generate_report.delay(idem_key, request.json or {})
-    r.setex(f"task:{idem_key}", 3600, async_res.id)
-    return jsonify({"status": "accepted", "poll": f"/jobs/{idem_key}"}), 202
+    try:
+        generate_report.apply_async((str(uuid.uuid4()), idem_key, request.json or {}), task_id=task_id)
+    except Exception:
+        jobs.release(idem_key, task_id)
+        raise
+    return jsonify({"status": ACCEPTED, "poll": f"/jobs/{idem_key}"}), 202
 
 
 @app.get("/jobs/<key>")
 def poll_job(key):
-    done = r.get(f"done:{key}")
-    if done:
-        return jsonify(json.loads(done))
-    task_id = r.get(f"task:{key}")
-    if not task_id:
+    job = jobs.get(key)
+    if job is None:
         return jsonify({"status": "unknown"}), 404
-    # 简版轮询：让 worker 在任务完成时写入 done:key，明天补
-    return jsonify({"status": "inflight"}), 202
+    if job.state == DONE:
+        return app.response_class(job.result, mimetype="application/json")
+    if job.state == FAILED:
+        return jsonify({"status": FAILED, "key": key, "error": job.error})
+    return jsonify({"status": job.state, "key": key}), 202
 
 
 # Add exception to a booking
@@ -124,10 +131,7 @@ def add_exception(id):
     if booking.exceptions is None:
         booking.exceptions = []
 
-    local_dt = datetime.strptime(data['exception_date'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    timezone_offset = data['timezoneOffset']
-    offset = timedelta(minutes=timezone_offset)
-    local_time = local_dt - offset
+    local_time = parse_client_time(data['exception_date'], data['timezoneOffset'])
     booking.exceptions.append(local_time.isoformat())
     db.session.commit()
 
@@ -146,11 +150,7 @@ def book_time():
     db.session.commit()
 
     psychologist_id = data['psychologist_id']
-    local_dt = datetime.strptime(data['date_time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    timezone_offset = data['timezoneOffset']
-    offset = timedelta(minutes=timezone_offset)
-    local_time = local_dt - offset
-    date_time = local_time
+    date_time = parse_client_time(data['date_time'], data['timezoneOffset'])
     is_recurring = data.get('is_recurring', False)
 
     new_booking = Booking(
@@ -183,11 +183,7 @@ def modify_booking(booking_id):
         return jsonify({'error': 'Booking not found'}), 404
 
     data = request.json
-    local_dt = datetime.strptime(data['newDateTime'], '%Y-%m-%dT%H:%M:%S.%fZ')
-    timezone_offset = data['timezoneOffset']
-    offset = timedelta(minutes=timezone_offset)
-    local_time = local_dt - offset
-    booking.date_time = local_time
+    booking.date_time = parse_client_time(data['newDateTime'], data['timezoneOffset'])
     booking.status = 'Pending'  # Reset approval
     db.session.commit()
     return booking_schema.jsonify(booking)
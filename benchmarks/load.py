@@ -0,0 +1,376 @@
+"""
+Load test of the booking API and the report pipeline.
+
+Seeds a database with synthetic psychologists, clients and bookings (a mix
+of weekly recurring series and one-off sessions) at one of several scales,
+then drives the real app with concurrent requests:
+
+    book       POST /book, one-off sessions in free slots
+    schedule   GET /schedule/{psychologist_id}
+    modify     PUT /modify/{booking_id}, moving seeded one-off sessions
+    report     POST /reports, then GET /jobs/{key}?wait= until it is done
+
+The app runs in-process (httpx ASGITransport, no network) or in a uvicorn
+process. Redis is an in-memory fakeredis unless --redis-url points at a
+real one. Celery runs the report tasks eagerly, inside the POST /reports
+request (no worker), so "report" measures the API plus the report itself.
+
+Throughput and p50/p95/p99 latency per scenario are written as JSON to
+--output. With --baseline the run is compared against an earlier results
+file: the exit status is 1 if any scenario's p95 grew, or its throughput
+fell, by more than --max-regression.
+
+    python -m benchmarks.load --scale small
+    python -m benchmarks.load --scale medium --mode uvicorn --output medium.json
+    python -m benchmarks.load --scale medium --baseline medium.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlalchemy import create_engine, insert
+
+# psychologists, recurring series and one-off sessions per psychologist
+SCALES = {
+    "small": {"psychologists": 10, "recurring": 5, "one_off": 20},
+    "medium": {"psychologists": 50, "recurring": 10, "one_off": 100},
+    "large": {"psychologists": 200, "recurring": 20, "one_off": 250},
+}
+SCENARIOS = ("book", "schedule", "modify", "report")
+# Reports are far heavier than the other scenarios; run fewer of them.
+REPORT_SHARE = 20
+
+# Weekly slot layout per psychologist, so generated bookings never overlap:
+# recurring series on weekdays 8:00-11:00, seeded one-offs on weekdays
+# 12:00-17:00, booked sessions on Saturdays and modified ones on Sundays.
+RECURRING_HOURS = range(8, 12)
+ONE_OFF_HOURS = range(12, 18)
+WEEKEND_HOURS = range(8, 18)
+WEEKS = 50
+
+
+def iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def first_monday() -> datetime:
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=7 - today.weekday())
+
+
+def slot(monday: datetime, week: int, weekday: int, hour: int) -> datetime:
+    return monday + timedelta(weeks=week, days=weekday, hours=hour)
+
+
+def seed(database_url: str, scale: dict, monday: datetime) -> dict:
+    """Recreate the schema and bulk-insert the synthetic data."""
+    from database import Base
+    from models import Booking, Client, Psychologist
+
+    recurring_slots = [(day, hour) for hour in RECURRING_HOURS for day in range(5)]
+    one_off_slots = [(week, day, hour) for week in range(WEEKS) for day in range(5) for hour in ONE_OFF_HOURS]
+    if scale["recurring"] > len(recurring_slots) or scale["one_off"] > len(one_off_slots):
+        raise ValueError("scale does not fit the weekly slot layout")
+
+    psychologists, clients, bookings = [], [], []
+    for p in range(1, scale["psychologists"] + 1):
+        psychologists.append({"id": p, "name": f"Dr. {p}"})
+        starts = [(slot(monday, 0, day, hour), True) for day, hour in recurring_slots[:scale["recurring"]]]
+        starts += [(slot(monday, *s), False) for s in one_off_slots[:scale["one_off"]]]
+        for date_time, is_recurring in starts:
+            client_id = len(clients) + 1
+            clients.append({"id": client_id, "name": f"client {client_id}"})
+            bookings.append({
+                "id": client_id,
+                "client_id": client_id,
+                "psychologist_id": p,
+                "date_time": date_time,
+                "is_recurring": is_recurring,
+                "status": "Approved" if client_id % 3 else "Pending",
+            })
+
+    connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+    engine = create_engine(database_url, connect_args=connect_args)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Psychologist), psychologists)
+        conn.execute(insert(Client), clients)
+        conn.execute(insert(Booking), bookings)
+    engine.dispose()
+    return {"psychologists": len(psychologists), "bookings": len(bookings)}
+
+
+def use_fake_redis() -> None:
+    """Swap the shared Redis clients for in-memory ones. Call before importing main."""
+    import fakeredis
+    import fakeredis.aioredis
+
+    from utils import redis_clients
+
+    server = fakeredis.FakeServer()
+    redis_clients.redis_client = fakeredis.FakeRedis(server=server)
+    redis_clients.async_redis_client = fakeredis.aioredis.FakeRedis(server=server)
+    redis_clients.async_pubsub_client = fakeredis.aioredis.FakeRedis(server=server)
+
+
+def load_app(fake_redis: bool):
+    """Import main, with report tasks run eagerly, and prepare the database."""
+    logging.disable(logging.CRITICAL)
+    if fake_redis:
+        use_fake_redis()
+    import main
+    from tasks.worker import celery_app
+
+    celery_app.conf.task_always_eager = True
+    # Materializes the recurring series up to the horizon.
+    main.startup_event()
+    return main
+
+
+def serve(fake_redis: bool, port: int) -> None:
+    import uvicorn
+
+    main = load_app(fake_redis)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+class Workload:
+    """
+    Requests of each scenario; every call gets its own free slot or key.
+    Each returns None on success, otherwise what went wrong (e.g. "409").
+    """
+
+    def __init__(self, scale: dict, monday: datetime):
+        self.scale = scale
+        self.monday = monday
+        self.weekend_slots = [(week, hour) for week in range(WEEKS) for hour in WEEKEND_HOURS]
+
+    def psychologist(self, i: int) -> int:
+        return i % self.scale["psychologists"] + 1
+
+    def weekend_slot(self, i: int, weekday: int) -> datetime:
+        per_psychologist = i // self.scale["psychologists"]
+        week, hour = self.weekend_slots[per_psychologist % len(self.weekend_slots)]
+        return slot(self.monday, week, weekday, hour)
+
+    async def book(self, client: httpx.AsyncClient, i: int) -> Optional[str]:
+        response = await client.post("/book", json={
+            "client_name": f"load {i}",
+            "psychologist_id": self.psychologist(i),
+            "date_time": iso(self.weekend_slot(i, 5)),
+            "timezoneOffset": 0,
+        })
+        return unexpected(response, 201)
+
+    async def schedule(self, client: httpx.AsyncClient, i: int) -> Optional[str]:
+        response = await client.get(f"/schedule/{self.psychologist(i)}")
+        return unexpected(response, 200)
+
+    async def modify(self, client: httpx.AsyncClient, i: int) -> Optional[str]:
+        # The i-th seeded one-off session, spread over the psychologists
+        p = self.psychologist(i)
+        per_psychologist = self.scale["recurring"] + self.scale["one_off"]
+        nth = self.scale["recurring"] + (i // self.scale["psychologists"]) % self.scale["one_off"]
+        booking_id = (p - 1) * per_psychologist + nth + 1
+        response = await client.put(f"/modify/{booking_id}", json={
+            "newDateTime": iso(self.weekend_slot(i, 6)),
+            "timezoneOffset": 0,
+        })
+        return unexpected(response, 200)
+
+    async def report(self, client: httpx.AsyncClient, i: int) -> Optional[str]:
+        key = str(uuid.uuid4())
+        response = await client.post("/reports", json={}, headers={"Idempotency-Key": key})
+        if response.status_code != 202:
+            return unexpected(response, 202)
+        while response.json().get("status") in ("accepted", "running"):
+            response = await client.get(f"/jobs/{key}", params={"wait": 30})
+        status = response.json().get("status")
+        return None if status == "done" else f"job {status}"
+
+
+def unexpected(response: httpx.Response, expected: int) -> Optional[str]:
+    return None if response.status_code == expected else str(response.status_code)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+async def drive(client: httpx.AsyncClient, scenario, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = Counter()
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            t0 = time.perf_counter()
+            try:
+                error = await scenario(client, i)
+            except httpx.HTTPError as exc:
+                error = type(exc).__name__
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if error is not None:
+                errors[error] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "rps": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+    }
+
+
+async def run_scenarios(client: httpx.AsyncClient, workload: Workload, requests: int, concurrency: int) -> dict:
+    # Warm up connections and the schedule cache.
+    await client.get("/schedule/1")
+    results = {}
+    for name in SCENARIOS:
+        count = max(requests // REPORT_SHARE, 1) if name == "report" else requests
+        results[name] = await drive(client, getattr(workload, name), count, min(concurrency, count))
+    return results
+
+
+async def run_in_process(main, workload: Workload, requests: int, concurrency: int) -> dict:
+    from database import async_engine
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        results = await run_scenarios(client, workload, requests, concurrency)
+    # aiosqlite connections run on non-daemon threads; close them so we can exit.
+    await async_engine.dispose()
+    return results
+
+
+async def run_over_http(base_url: str, workload: Workload, requests: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        return await run_scenarios(client, workload, requests, concurrency)
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Scenarios whose p95 or throughput regressed beyond `max_regression`."""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if current["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {before['rps']} -> {current['rps']} req/s")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--mode", choices=("in-process", "uvicorn"), default="in-process")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db", help="recreated on every run")
+    parser.add_argument("--redis-url", help="a real Redis (its data is left behind); fakeredis if omitted")
+    parser.add_argument("--requests", type=int, default=500, help=f"per scenario (reports: 1/{REPORT_SHARE} of it)")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", default="load-results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed fraction, e.g. 0.2")
+    args = parser.parse_args()
+
+    # Read at import time by database and utils.redis_clients
+    os.environ["DATABASE_URL"] = args.database_url
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+
+    scale = SCALES[args.scale]
+    monday = first_monday()
+    started = time.perf_counter()
+    seeded = seed(args.database_url, scale, monday)
+    main_module = load_app(fake_redis=not args.redis_url)
+    seed_seconds = round(time.perf_counter() - started, 2)
+    workload = Workload(scale, monday)
+
+    if args.mode == "in-process":
+        scenarios = asyncio.run(run_in_process(main_module, workload, args.requests, args.concurrency))
+    else:
+        # Imported late: it imports database, which must see DATABASE_URL first.
+        from benchmarks.async_db import free_port, wait_until_up
+
+        # Do not share the seeding process's pooled connections with the server.
+        main_module.engine.dispose()
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = multiprocessing.Process(target=serve, args=(not args.redis_url, port), daemon=True)
+        server.start()
+        try:
+            wait_until_up(base_url)
+            scenarios = asyncio.run(run_over_http(base_url, workload, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.join()
+
+    results = {
+        "scale": args.scale,
+        "mode": args.mode,
+        "database_url": args.database_url,
+        "redis": args.redis_url or "fakeredis",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seeded": {**seeded, "seconds": seed_seconds},
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for setting in ("scale", "mode", "database_url", "concurrency"):
+            if baseline.get(setting) != results[setting]:
+                print(f"WARNING baseline {setting} differs: {baseline.get(setting)!r}", file=sys.stderr)
+        regressions = compare(results, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
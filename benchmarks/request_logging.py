@@ -0,0 +1,105 @@
+"""
+Request logging middleware: BaseHTTPMiddleware vs pure ASGI.
+
+Serves a trivial JSON endpoint from three uvicorn processes (no logging
+middleware, the previous BaseHTTPMiddleware implementation, and the current
+pure ASGI RequestLoggingMiddleware), drives each with concurrent requests and
+prints requests/sec and latency percentiles as JSON. Log lines are formatted
+by the production logging pipeline but written to /dev/null.
+
+    python -m benchmarks.request_logging
+    python -m benchmarks.request_logging --sample-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks.async_db import drive, free_port, wait_until_up
+from utils.logging_config import setup_logging
+
+MODES = ("none", "base_http", "asgi")
+
+
+class BaseHTTPRequestLogging(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware implementation RequestLoggingMiddleware replaced."""
+
+    def __init__(self, app, logger: logging.Logger):
+        super().__init__(app)
+        self.logger = logger
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = str(uuid.uuid4())
+        request.state.request_id = request_id
+        start_time = time.perf_counter()
+        response = await call_next(request)
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        response.headers["X-Request-ID"] = request_id
+        route = request.scope.get("route")
+        self.logger.info("http_request", extra={
+            "request_id": request_id,
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "client": request.client.host if request.client else None,
+            "latency_ms": round(latency_ms, 2),
+            "user_agent": request.headers.get("User-Agent", "unknown"),
+            "route": route.name if route else "unknown",
+        })
+        return response
+
+
+def build_app(mode: str, sample_rate: float) -> FastAPI:
+    # Set up logging before main does, so log lines go to /dev/null.
+    # Imported here so only the server processes pay for importing the app.
+    setup_logging(stream=open(os.devnull, "w"))
+    import main
+
+    app = FastAPI()
+
+    @app.get(f"/{mode}/{{item_id}}")
+    async def item(item_id: int):
+        return {"id": item_id, "status": "ok"}
+
+    if mode == "base_http":
+        app.add_middleware(BaseHTTPRequestLogging, logger=main.logger)
+    elif mode == "asgi":
+        app.add_middleware(main.RequestLoggingMiddleware, sample_rate=sample_rate)
+    return app
+
+
+def serve(mode: str, sample_rate: float, port: int) -> None:
+    uvicorn.run(build_app(mode, sample_rate), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--sample-rate", type=float, default=1.0, help="2xx sample rate for the ASGI middleware")
+    args = parser.parse_args()
+
+    results = {"concurrency": args.concurrency, "sample_rate": args.sample_rate}
+    for mode in MODES:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = multiprocessing.Process(target=serve, args=(mode, args.sample_rate, port), daemon=True)
+        server.start()
+        wait_until_up(base_url)
+        results[mode] = asyncio.run(drive(base_url, f"/{mode}", 100, args.requests, args.concurrency))
+        server.terminate()
+        server.join()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
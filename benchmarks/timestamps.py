@@ -0,0 +1,76 @@
+"""
+Parse throughput of client timestamps: strptime vs utils.timestamps.
+
+Parses the same generated Date.toISOString() strings (with timezone
+offsets) with the strptime code the endpoints used before, with
+parse_client_time() one at a time, and with parse_timestamps() as a bulk
+payload would. Prints timestamps/sec and ns per timestamp (best of
+--repeat runs) for each as JSON.
+
+    python -m benchmarks.timestamps
+    python -m benchmarks.timestamps --count 100000 --repeat 7
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from utils.timestamps import parse_client_time, parse_timestamps, to_client_time
+
+STRPTIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def payload(count: int, seed: int = 0) -> list:
+    """(toISOString() timestamp, timezoneOffset) pairs."""
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    return [
+        (
+            (start + timedelta(seconds=rnd.randrange(10 ** 9))).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            rnd.choice((-330, 0, 60, 240, 300, 480)),
+        )
+        for _ in range(count)
+    ]
+
+
+def strptime_parse(rows: list) -> list:
+    return [datetime.strptime(value, STRPTIME_FORMAT) - timedelta(minutes=offset) for value, offset in rows]
+
+
+def single_parse(rows: list) -> list:
+    return [parse_client_time(value, offset) for value, offset in rows]
+
+
+def batch_parse(rows: list) -> list:
+    timestamps = parse_timestamps(value for value, _ in rows)
+    return [to_client_time(timestamp, offset) for timestamp, (_, offset) in zip(timestamps, rows)]
+
+
+PARSERS = {"strptime": strptime_parse, "parse_client_time": single_parse, "parse_timestamps": batch_parse}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=50000, help="timestamps per run")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = payload(args.count)
+    expected = strptime_parse(rows)
+    results = {}
+    for name, parse in PARSERS.items():
+        if parse(rows) != expected:
+            raise SystemExit(f"{name} disagrees with strptime")
+        best = min(timeit.repeat(lambda: parse(rows), number=1, repeat=args.repeat))
+        results[name] = {
+            "per_sec": round(args.count / best),
+            "ns_per_timestamp": round(best / args.count * 1e9),
+        }
+    for name in PARSERS:
+        results[name]["speedup"] = round(results["strptime"]["ns_per_timestamp"] / results[name]["ns_per_timestamp"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Interval index used to reject double bookings.
+
+An index holds a psychologist's sessions as a sorted array of (session
+start, booking id) pairs from `booking_occurrence`. Every session lasts
+`SESSION_DURATION`, so a new session [s, s + d) overlaps an existing one
+exactly when an existing start lies in (s - d, s + d); two binary searches
+find those in O(log n).
+
+Recurring series are only materialized up to the rolling horizon, so the
+index also keeps each series' first session and skipped weeks. Sessions
+past the horizon are checked against the series by date arithmetic.
+
+Writes for a psychologist bump `psychologist.schedule_version` before the
+conflict check. That UPDATE locks the psychologist's row until the write
+commits, so concurrent requests, in this process or any other, cannot both
+pass the check for the same slot. Under the lock a single write loads only
+the sessions near its own (load_index), with indexed range queries on
+(psychologist_id, start_time); nothing is cached between requests, so
+writes from other processes need no rebuild. Bulk writes load the whole
+schedule once per batch (build_index).
+"""
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from availability import RECURRENCE_STEP, SESSION_DURATION, week_key
+from models import Booking, BookingException, BookingOccurrence, Psychologist
+from occurrences import ensure_horizon
+
+
+class BookingConflict(Exception):
+    """A write would overlap sessions of the given bookings."""
+
+    def __init__(self, booking_ids: Set[int]):
+        super().__init__(f"Overlaps bookings {sorted(booking_ids)}")
+        self.booking_ids = booking_ids
+
+
+class Series(NamedTuple):
+    """The regular sessions of a recurring booking, as in series_occurrences()."""
+
+    first: datetime
+    skipped_weeks: FrozenSet[date]
+
+    def overlaps(self, start: datetime) -> bool:
+        """Whether a regular session of the series overlaps one starting at `start`."""
+        # Sessions are shorter than half a week, so only the regular sessions
+        # just before and just after `start` can overlap it.
+        steps = (start - self.first) // RECURRENCE_STEP
+        for step in (steps, steps + 1):
+            if step >= 0:
+                session = self.first + step * RECURRENCE_STEP
+                if abs(session - start) < SESSION_DURATION and week_key(session) not in self.skipped_weeks:
+                    return True
+        return False
+
+    def collides_with(self, other: "Series") -> bool:
+        """
+        Whether the two series overlap in some week. Both repeat forever and
+        skip finitely many weeks, so they do exactly when their times of
+        week are less than a session apart.
+        """
+        apart = (self.first - other.first) % RECURRENCE_STEP
+        return apart < SESSION_DURATION or RECURRENCE_STEP - apart < SESSION_DURATION
+
+
+def booking_series(booking: Booking) -> Optional[Series]:
+    """The regular sessions of `booking`, or None for a one-off booking."""
+    if not booking.is_recurring:
+        return None
+    return Series(booking.date_time, frozenset(week_key(dt) for dt in booking.exception_dates))
+
+
+class IntervalIndex:
+    """Sorted session starts and recurring series of one psychologist."""
+
+    def __init__(
+        self,
+        sessions: Iterable[Tuple[datetime, int]],
+        covers_until: Optional[datetime],
+        series: Iterable[Tuple[int, Series]] = (),
+    ):
+        self._entries: List[Tuple[datetime, int]] = sorted(sessions)
+        self._by_booking: Dict[int, List[datetime]] = {}
+        for start, booking_id in self._entries:
+            self._by_booking.setdefault(booking_id, []).append(start)
+        self._series: Dict[int, Series] = dict(series)
+        # Horizon of booking_occurrence when the index was built: every
+        # session starting before it is stored. None when none are, as for
+        # bookings that are not written yet.
+        self.covers_until = covers_until
+
+    def _past_horizon(self, start: datetime) -> bool:
+        return self.covers_until is None or start + SESSION_DURATION > self.covers_until
+
+    def conflicts(
+        self, starts: Iterable[datetime], exclude: Optional[int] = None, series: Optional[Series] = None
+    ) -> Set[int]:
+        """
+        Ids of bookings with a session overlapping any of `starts`, or any
+        regular session of `series` if the new booking is recurring.
+        """
+        found: Set[int] = set()
+        for start in starts:
+            lo = bisect_right(self._entries, (start - SESSION_DURATION, float("inf")))
+            hi = bisect_left(self._entries, (start + SESSION_DURATION, float("-inf")))
+            for _, booking_id in self._entries[lo:hi]:
+                if booking_id != exclude:
+                    found.add(booking_id)
+            if self._past_horizon(start):
+                for booking_id, other in self._series.items():
+                    if booking_id != exclude and other.overlaps(start):
+                        found.add(booking_id)
+
+        if series is not None:
+            # `starts` holds the new series only up to the horizon; past it,
+            # test its regular sessions against the other series and against
+            # the one-off sessions and exceptions stored there.
+            for booking_id, other in self._series.items():
+                if booking_id != exclude and series.collides_with(other):
+                    found.add(booking_id)
+            lo = 0
+            if self.covers_until is not None:
+                lo = bisect_left(self._entries, (self.covers_until - SESSION_DURATION, float("-inf")))
+            for start, booking_id in self._entries[lo:]:
+                if booking_id != exclude and series.overlaps(start):
+                    found.add(booking_id)
+        return found
+
+    def check(
+        self, starts: Iterable[datetime], exclude: Optional[int] = None, series: Optional[Series] = None
+    ) -> None:
+        """Raise BookingConflict if the new sessions overlap another booking."""
+        booking_ids = self.conflicts(starts, exclude, series)
+        if booking_ids:
+            raise BookingConflict(booking_ids)
+
+    def remove(self, booking_id: int) -> None:
+        self._series.pop(booking_id, None)
+        for start in self._by_booking.pop(booking_id, []):
+            i = bisect_left(self._entries, (start, booking_id))
+            if i < len(self._entries) and self._entries[i] == (start, booking_id):
+                del self._entries[i]
+
+    def replace(self, booking_id: int, starts: Iterable[datetime], series: Optional[Series] = None) -> None:
+        self.remove(booking_id)
+        starts = sorted(starts)
+        for start in starts:
+            insort(self._entries, (start, booking_id))
+        if starts:
+            self._by_booking[booking_id] = starts
+        if series is not None:
+            self._series[booking_id] = series
+
+
+def lock_schedule(db: Session, psychologist_id: int) -> None:
+    """Bump the psychologist's schedule_version, locking their row until the transaction ends."""
+    db.execute(
+        update(Psychologist)
+        .where(Psychologist.id == psychologist_id)
+        .values(schedule_version=Psychologist.schedule_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _load_series(
+    db: Session, psychologist_id: int, skipped_since: Optional[datetime] = None
+) -> List[Tuple[int, Series]]:
+    skipped = BookingException.booking_id == Booking.id
+    if skipped_since is not None:
+        skipped &= BookingException.occurrence_date >= skipped_since
+    first: Dict[int, datetime] = {}
+    skipped_weeks: Dict[int, Set[date]] = {}
+    for booking_id, date_time, occurrence_date in db.execute(
+        select(Booking.id, Booking.date_time, BookingException.occurrence_date)
+        .outerjoin(BookingException, skipped)
+        .where(Booking.psychologist_id == psychologist_id, Booking.is_recurring)
+    ):
+        first[booking_id] = date_time
+        weeks = skipped_weeks.setdefault(booking_id, set())
+        if occurrence_date is not None:
+            weeks.add(week_key(occurrence_date))
+    return [(booking_id, Series(first[booking_id], frozenset(weeks))) for booking_id, weeks in skipped_weeks.items()]
+
+
+def build_index(db: Session, psychologist_id: int, covers_until: datetime) -> IntervalIndex:
+    """The psychologist's whole schedule."""
+    rows = db.execute(
+        select(BookingOccurrence.start_time, BookingOccurrence.booking_id)
+        .where(BookingOccurrence.psychologist_id == psychologist_id)
+    ).all()
+    return IntervalIndex(
+        ((start, booking_id) for start, booking_id in rows), covers_until, _load_series(db, psychologist_id)
+    )
+
+
+def load_index(
+    db: Session,
+    psychologist_id: int,
+    covers_until: datetime,
+    starts: Sequence[datetime],
+    series: Optional[Series] = None,
+) -> IntervalIndex:
+    """
+    The part of the psychologist's schedule that sessions `starts`, and the
+    regular sessions of `series`, could overlap. Its conflicts() for those
+    arguments are those of the whole build_index().
+
+    Stored sessions come from range queries on (psychologist_id,
+    start_time), one per start. Recurring series are only needed past the
+    horizon, and there only their skipped weeks near or after it.
+    """
+    windows = [
+        (BookingOccurrence.start_time > start - SESSION_DURATION)
+        & (BookingOccurrence.start_time < start + SESSION_DURATION)
+        for start in starts
+    ]
+    if series is not None:
+        # Stored sessions the series may overlap past the horizon
+        windows.append(BookingOccurrence.start_time >= covers_until - SESSION_DURATION)
+    rows = []
+    if windows:
+        rows = db.execute(
+            select(BookingOccurrence.start_time, BookingOccurrence.booking_id)
+            .where(BookingOccurrence.psychologist_id == psychologist_id, or_(*windows))
+        ).all()
+    other_series = []
+    if series is not None or any(start + SESSION_DURATION > covers_until for start in starts):
+        # A session overlapping one past the horizon starts after
+        # covers_until - 2 * SESSION_DURATION; that week is the first to matter.
+        skipped_since = covers_until - 2 * SESSION_DURATION - RECURRENCE_STEP
+        other_series = _load_series(db, psychologist_id, skipped_since)
+    return IntervalIndex(((start, booking_id) for start, booking_id in rows), covers_until, other_series)
+
+
+class LockedSchedule:
+    """A psychologist's schedule, locked for a write on `db` by BookingConflicts.locked()."""
+
+    def __init__(self, db: AsyncSession, psychologist_id: int, covers_until: datetime):
+        self.db = db
+        self.psychologist_id = psychologist_id
+        # Horizon of booking_occurrence
+        self.covers_until = covers_until
+
+    async def conflicts(
+        self, starts: Iterable[datetime], exclude: Optional[int] = None, series: Optional[Series] = None
+    ) -> Set[int]:
+        """IntervalIndex.conflicts() against the stored bookings."""
+        starts = list(starts)
+        index = await self.db.run_sync(load_index, self.psychologist_id, self.covers_until, starts, series)
+        return index.conflicts(starts, exclude, series)
+
+    async def check(
+        self, starts: Iterable[datetime], exclude: Optional[int] = None, series: Optional[Series] = None
+    ) -> None:
+        """Raise BookingConflict if the new sessions overlap a stored booking."""
+        booking_ids = await self.conflicts(starts, exclude, series)
+        if booking_ids:
+            raise BookingConflict(booking_ids)
+
+    async def load(self) -> IntervalIndex:
+        """The whole schedule, for checking many bookings in one go."""
+        return await self.db.run_sync(build_index, self.psychologist_id, self.covers_until)
+
+
+def _lock(db: Session, psychologist_id: int) -> datetime:
+    # Before taking the row lock: extending the horizon commits. Once this
+    # process has extended it, later calls do not for a day.
+    covers_until = ensure_horizon(db)
+    lock_schedule(db, psychologist_id)
+    return covers_until
+
+
+class BookingConflicts:
+    """Per-psychologist write locks."""
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def _lock_for(self, psychologist_id: int) -> asyncio.Lock:
+        # No await between lookup and insert, so this is atomic on the loop.
+        lock = self._locks.get(psychologist_id)
+        if lock is None:
+            lock = self._locks[psychologist_id] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def locked(self, db: AsyncSession, psychologist_id: int) -> AsyncIterator[LockedSchedule]:
+        """
+        Lock the psychologist's schedule for a write on `db` and yield it.
+        Check the write against it and commit before leaving the block; the
+        row lock is released by the commit. The asyncio lock keeps this
+        process's writers from queueing on the row lock with a connection
+        each.
+        """
+        async with self._lock_for(psychologist_id):
+            try:
+                covers_until = await db.run_sync(_lock, psychologist_id)
+                yield LockedSchedule(db, psychologist_id, covers_until)
+            except BookingConflict:
+                # Nothing was written; drop the version bump and the row lock.
+                await db.rollback()
+                raise
+
+
+booking_conflicts = BookingConflicts()
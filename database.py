@@ -1,16 +1,198 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.concurrency import run_in_threadpool
+
+from utils.metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, track_pool, track_queries
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./schedule.db")
 
+
+def to_async_url(url: str) -> str:
+    """Swap a sync driver URL for its asyncio driver (aiosqlite / asyncpg)."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(SQLALCHEMY_DATABASE_URL))
+
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+# Pool settings, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+
+# SQLite tuning, applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Serve the async handlers from the sync engine through the threadpool
+# (ThreadedSession) instead of the asyncio driver. aiosqlite hops to its
+# own thread for every DBAPI call, and benchmarks/async_db.py measures it
+# at well under half the throughput of the sync engine, so this is the
+# default on SQLite.
+DB_THREADED_SESSIONS = _env_bool("DB_THREADED_SESSIONS", IS_SQLITE)
+
+
+def _pool_options(name: str, poolclass) -> dict:
+    return {
+        "poolclass": poolclass,
+        "pool_logging_name": name,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_pool_options("sync", TimedQueuePool),
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the FastAPI handlers, unless DB_THREADED_SESSIONS.
+# Either way their sessions keep objects loaded after commit, since lazy
+# refreshes are not possible outside an awaited call.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **_pool_options("async", TimedAsyncAdaptedQueuePool),
+)
+
+
+class _ThreadedResult:
+    """The part of AsyncResult that export streaming uses."""
+
+    def __init__(self, result):
+        self._result = result
+
+    async def partitions(self, size=None):
+        partitions = self._result.partitions(size)
+        while True:
+            rows = await run_in_threadpool(next, partitions, None)
+            if rows is None:
+                return
+            yield rows
+
+
+class ThreadedSession:
+    """
+    The AsyncSession methods the handlers use, over a sync Session. Each
+    awaited call runs in the threadpool, and results are buffered there, so
+    the event loop never waits on the database.
+    """
+
+    _BUFFERED = {"prebuffer_rows": True}
+
+    def __init__(self, sync_session: Session):
+        self.sync_session = sync_session
+
+    async def __aenter__(self) -> "ThreadedSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _options(self, execution_options) -> dict:
+        return {**self._BUFFERED, **(execution_options or {})}
+
+    async def execute(self, statement, params=None, *, execution_options=None, **kw):
+        return await run_in_threadpool(
+            self.sync_session.execute, statement, params, execution_options=self._options(execution_options), **kw
+        )
+
+    async def scalar(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kw)
+
+    async def scalars(self, statement, params=None, *, execution_options=None, **kw):
+        return await run_in_threadpool(
+            self.sync_session.scalars, statement, params, execution_options=self._options(execution_options), **kw
+        )
+
+    async def stream(self, statement, params=None, **kw) -> _ThreadedResult:
+        return _ThreadedResult(await run_in_threadpool(self.sync_session.execute, statement, params, **kw))
+
+    async def get(self, entity, ident, **kw):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kw)
+
+    async def run_sync(self, fn, *args, **kw):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kw)
+
+    async def delete(self, instance) -> None:
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self) -> None:
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    def add_all(self, instances) -> None:
+        self.sync_session.add_all(instances)
+
+    def in_transaction(self) -> bool:
+        return self.sync_session.in_transaction()
+
+
+if DB_THREADED_SESSIONS:
+    _ThreadedSessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    def AsyncSessionLocal() -> ThreadedSession:
+        return ThreadedSession(_ThreadedSessionLocal())
+
+    # The engine the handlers' statements run on
+    session_engine = engine
+else:
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+    session_engine = async_engine.sync_engine
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+track_pool("sync", engine.pool)
+track_pool("async", async_engine.pool)
+track_queries(engine)
+track_queries(async_engine.sync_engine)
+
 Base = declarative_base()
 
 # Dependency to get a DB session
@@ -19,4 +201,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
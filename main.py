@@ -1,68 +1,56 @@
-import json, os, redis
-from datetime import datetime, timedelta
-from typing import Optional, List
-
-from fastapi import FastAPI, Depends, HTTPException, Header, Request
+import base64, csv, hashlib, io, json, os
+from contextlib import AsyncExitStack
+from datetime import date, datetime
+from collections import defaultdict
+from typing import Dict, Optional, List, Tuple
+
+import orjson
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy import String, ForeignKey, DateTime, Boolean, create_engine
-from sqlalchemy.orm import Mapped, mapped_column, relationship, Session
-from sqlalchemy.dialects.postgresql import JSON
-
-from database import Base, engine, get_db
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from sqlalchemy import DateTime, delete, insert, literal, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal, Base, async_engine, engine, get_async_db
+from models import (
+    Psychologist, Client, Booking, BookingCancellation, BookingException, BookingOccurrence,
+)
+from migrations import add_schedule_version, migrate_legacy_exceptions
+from availability import SESSION_DURATION, expand_booking, free_slots, lookup_range
+from occurrences import (
+    add_exception_occurrence, add_occurrences, delete_occurrences, ensure_horizon,
+    planned_sessions, rebuild_occurrences,
+)
+from conflicts import BookingConflict, IntervalIndex, booking_conflicts, booking_series
+from utils.cache import VersionedCache
+from utils.job_events import TERMINAL_STATUSES, JobSubscription
+from utils.jobs import ACCEPTED, DONE, FAILED, PENDING_STATES, AsyncJobStore, Job
+from utils.logging_config import setup_logging
+from utils.result_store import result_store
+from utils.timestamps import parse_client_time, parse_timestamps, to_client_time
+from utils.metrics import (
+    SQL_REPEAT_THRESHOLD, PrometheusMiddleware, QueryStats, current_query_stats, render_metrics,
+)
+from utils.redis_clients import async_pubsub_client, async_redis_client
 from tasks.reporting import generate_report
 
 import logging
 import json
+import random
 import uuid
 import time
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST
 import traceback
 
 
 
-# JSON logger configuration
+# JSON logs go through the shared queue-based pipeline
+setup_logging()
 logger = logging.getLogger("psychologist health")
-logger.propagate = False
-logger.setLevel(logging.INFO)
-
-handler = logging.StreamHandler()
-handler.setLevel(logging.INFO)
-
-class JsonRequestFormatter(logging.Formatter):
-    def format(self, record: logging.LogRecord) -> str:
-        # Start from message or dict payload
-        if isinstance(record.msg, dict):
-            log_record = dict(record.msg)  # shallow copy to avoid mutating original
-        else:
-            log_record = {"message": record.getMessage()}
-
-        log_record.setdefault("level", record.levelname)
-        log_record.setdefault("logger", record.name)
-
-        # Keys from LogRecord we do NOT want to copy (internal fields)
-        reserved_keys = {
-            "message",
-            "msg",
-            "args",
-            "name",
-            "levelname",
-            "levelno",
-        }
-
-        # Merge extra fields into log_record
-        for key, value in record.__dict__.items():
-            if key in reserved_keys:
-                continue
-            log_record[key] = value
-
-        return json.dumps(log_record, ensure_ascii=False)
-
-
-handler.setFormatter(JsonRequestFormatter())
-logger.handlers.clear()
-logger.addHandler(handler)
 
 
 # Initialize FastAPI app
@@ -80,39 +68,97 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class RequestLoggingMiddleware:
+    """
+    Pure ASGI request logging. Every request gets an id (on request.state
+    for the exception handlers, and in the X-Request-ID response header) and
+    one "http_request" log line once it has been served.
+
+    Successful (2xx) requests can be sampled with `sample_rate`; everything
+    else is always logged. Unlike BaseHTTPMiddleware this adds no extra task
+    or memory stream per request and passes streaming responses through.
+
+    The line includes the request's SQL statement count and time (collected
+    by PrometheusMiddleware). With SQL_PROFILING on, it also counts repeated
+    statements, sends them in a Server-Timing header, and warns when one
+    statement ran more than SQL_REPEAT_THRESHOLD times (an N+1 query).
+    """
+
+    def __init__(self, app, sample_rate: float = 1.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         request_id = str(uuid.uuid4())
         # store on request.state so handlers can use it later if needed
-        request.state.request_id = request_id
+        scope.setdefault("state", {})["request_id"] = request_id
         start_time = time.perf_counter()
-        response = await call_next(request)
-        # compute latency in ms
-        latency_ms = (time.perf_counter() - start_time) * 1000
-        # response.headers["Access-Control-Allow-Origin"]  = "https://phs-70gu.onrender.com"
-        # response.headers["Access-Control-Allow-Headers"] = "*"
-        # response.headers["Access-Control-Allow-Methods"] = "*"
-        response.headers["X-Request-ID"] = request_id
-        user_agent = request.headers.get("User-Agent", "unknown")
-        route_name = request.scope.get("route").name if request.scope.get("route") else "unknown"
-
+        status = 500
+
+        query_stats = current_query_stats.get()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", request_id)
+                if query_stats is not None and query_stats.shapes is not None:
+                    # Statements run while streaming the body are not included.
+                    headers.append("Server-Timing", query_stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            if not (200 <= status < 300) or self.sample_rate >= 1 or random.random() < self.sample_rate:
+                self.log(scope, request_id, status, (time.perf_counter() - start_time) * 1000, query_stats)
+            if query_stats is not None:
+                for statement, repeats in query_stats.repeated(SQL_REPEAT_THRESHOLD):
+                    logger.warning("sql_repeated_statement", extra={
+                        "request_id": request_id,
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "statement": statement[:500],
+                        "repeats": repeats,
+                    })
+
+    def log(
+        self, scope, request_id: str, status: int, latency_ms: float, query_stats: Optional[QueryStats] = None
+    ) -> None:
+        headers = Headers(scope=scope)
+        route = scope.get("route")
+        client = scope.get("client")
         log_data = {
             "request_id": request_id,
-            "method": request.method,
-            "path": request.url.path,
-            "status": response.status_code,
-            "client": request.client.host if request.client else None,
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status,
+            "client": client[0] if client else None,
             "latency_ms": round(latency_ms, 2),  # round to 2 decimals
-            "user_agent": user_agent,
-            "route": route_name
+            "user_agent": headers.get("User-Agent", "unknown"),
+            "route": route.name if route else "unknown",
         }
+        if query_stats is not None:
+            log_data["db_queries"] = query_stats.count
+            log_data["db_time_ms"] = round(query_stats.seconds * 1000, 2)
+            if query_stats.shapes is not None:
+                log_data["db_repeated"] = query_stats.duplicates()
         logger.info("http_request", extra=log_data)
-        
-        return response
 
-app.add_middleware(RequestLoggingMiddleware)
+# Fraction of 2xx requests logged (errors and non-2xx are always logged)
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", "1.0"))
+
+app.add_middleware(RequestLoggingMiddleware, sample_rate=REQUEST_LOG_SAMPLE_RATE)
+# Outermost, so its latency covers the other middleware too
+app.add_middleware(PrometheusMiddleware)
 
 
 @app.exception_handler(Exception)
@@ -181,36 +227,41 @@ async def http_exception_handler(request: Request, exc: HTTPException):
             "detail": exc.detail,
             "request_id": request_id,
         },
+        headers=exc.headers,
+    )
+
+@app.exception_handler(BookingConflict)
+async def booking_conflict_handler(request: Request, exc: BookingConflict):
+    """Reject overlapping writes with 409, in the same envelope as HTTPException."""
+    return await http_exception_handler(
+        request,
+        HTTPException(
+            status_code=409,
+            detail={
+                "message": "Requested time overlaps an existing booking",
+                "conflicting_booking_ids": sorted(exc.booking_ids),
+            },
+        ),
     )
 
 
-# Redis client
-r = redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
-
-# SQLAlchemy Models
-class Psychologist(Base):
-    __tablename__ = "psychologist"
-    id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(30))
-    bookings: Mapped[list["Booking"]] = relationship("Booking", back_populates="psychologist")
-
-class Client(Base):
-    __tablename__ = "client"
-    id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(30))
-    booking: Mapped["Booking"] = relationship("Booking", back_populates="client")
-
-class Booking(Base):
-    __tablename__ = "booking"
-    id: Mapped[int] = mapped_column(primary_key=True)
-    date_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    is_recurring: Mapped[bool] = mapped_column(Boolean, default=False)
-    exceptions: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
-    status: Mapped[str] = mapped_column(String(20), default='Pending')
-    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), unique=True)
-    client: Mapped["Client"] = relationship("Client", back_populates="booking")
-    psychologist_id: Mapped[int] = mapped_column(ForeignKey("psychologist.id"))
-    psychologist: Mapped["Psychologist"] = relationship("Psychologist", back_populates="bookings")
+# Redis clients, from the per-process pools shared with every module
+ar = async_redis_client
+# Job event subscriptions, which hold their connection while a client waits
+pubsub = async_pubsub_client
+# Report jobs by Idempotency-Key
+jobs = AsyncJobStore(ar)
+
+# Serialized schedule and availability responses, versioned per psychologist.
+# Every booking write invalidates the psychologist's entries.
+schedule_cache = VersionedCache(
+    ar,
+    "schedule",
+    ttl=int(os.getenv("SCHEDULE_CACHE_TTL", "300")),
+)
+
+# Whether the database can return rows from UPDATE (PostgreSQL, SQLite >= 3.35)
+UPDATE_RETURNING = async_engine.dialect.update_returning
 
 # Pydantic Schemas for data validation and serialization
 class BookingBase(BaseModel):
@@ -240,6 +291,12 @@ class BookingSchema(BookingBase):
     psychologist_id: int
     exceptions: Optional[list] = None
 
+class AvailabilitySlot(BaseModel):
+    start: datetime
+    end: datetime
+
+slot_list_adapter = TypeAdapter(List[AvailabilitySlot])
+
 @app.get("/test-http-exception")
 async def test_http_exception():
     """
@@ -261,7 +318,8 @@ async def test_global_exception():
 def debug_file_check():
     return {
         "file_loaded_by_render": "main.py",
-        "has_request_id_code": hasattr(RequestLoggingMiddleware, "dispatch"),
+        # The pure ASGI middleware has no dispatch(); check it is installed.
+        "has_request_id_code": any(m.cls is RequestLoggingMiddleware for m in app.user_middleware),
         "signature": "v3-hello-test"
     }
 
@@ -278,128 +336,901 @@ async def create_report(request: Request, idempotency_key: Optional[str] = Heade
     if not idempotency_key:
         raise HTTPException(status_code=400, detail="Missing Idempotency-Key")
 
-    # Fetch any existing completed result based on idempotency key.
-    done = r.get(f"done:{idempotency_key}")
-    if done:
-        return json.loads(done)
-
-    # Try to mark this job as inflight (NX prevents duplicates).
-    ok = r.set(f"inflight:{idempotency_key}", "1", nx=True, ex=3600)
-    if not ok:
-        return {"status": "inflight", "poll": f"/jobs/{idempotency_key}"}
-
     # Get request body (may be empty).
     payload = await request.json()
 
+    # One atomic round trip: return the finished result, report a job
+    # already in progress, or claim the key (also after a failure) with the
+    # id our task will run under.
+    task_id = str(uuid.uuid4())
+    job = await jobs.claim(idempotency_key, task_id)
+    if job is not None and job.state == DONE:
+        return json.loads(job.result)
+    if job is not None:
+        return {"status": job.state, "poll": f"/jobs/{idempotency_key}"}
+
     # Grab request_id generated by RequestLoggingMiddleware.
     # Fallback to a new UUID if, for some reason, it is missing.
     request_id = getattr(request.state, "request_id", str(uuid.uuid4()))
 
     # Enqueue Celery task with both request_id and idempotency key.
-    async_res = generate_report.delay(request_id, idempotency_key, payload or {})
+    # Publishing to the broker blocks, so keep it off the event loop.
+    try:
+        await run_in_threadpool(
+            generate_report.apply_async, (request_id, idempotency_key, payload or {}), task_id=task_id
+        )
+    except Exception:
+        # Do not leave the key claimed by a task that will never run.
+        await jobs.release(idempotency_key, task_id)
+        raise
 
-    # Store Celery task_id for later polling.
-    r.setex(f"task:{idempotency_key}", 3600, async_res.id)
-
-    return {"status": "accepted", "poll": f"/jobs/{idempotency_key}"}
+    return {"status": ACCEPTED, "poll": f"/jobs/{idempotency_key}"}
 
 
 @app.get("/healthz")
 def healthz():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """True if an If-None-Match header value matches `etag` (weak comparison)."""
+    if not if_none_match or etag is None:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+# Longest a client may hold a /jobs/{key}?wait= long-poll open, in seconds
+MAX_JOB_WAIT = 60
+# Comment lines sent on an idle event stream so proxies keep it open
+SSE_HEARTBEAT = 15
+# Event streams are closed after this long; EventSource reconnects by itself
+SSE_MAX_DURATION = 300
+
+def job_status(key: str, job: Job) -> dict:
+    """Status body of an unfinished or failed job (the shape of its events)."""
+    status = {"status": job.state, "key": key}
+    if job.state == FAILED:
+        status["error"] = job.error
+    return status
+
 @app.get("/jobs/{key}")
-def poll_job(key: str):
-    done = r.get(f"done:{key}")
-    if done:
-        return json.loads(done)
-    task_id = r.get(f"task:{key}")
-    if not task_id:
+async def poll_job(
+    key: str,
+    wait: int = Query(0, ge=0, le=MAX_JOB_WAIT),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Job status: accepted, running, done (the result) or failed (the
+    error). The job is read in one round trip; the ETag is derived from its
+    Celery task id and state, so a client polling with If-None-Match gets a
+    bodiless 304 until the state changes.
+
+    With ?wait=N an unfinished job is a long-poll: the response is held
+    until the worker announces that the job finished or failed, or for N
+    seconds, whichever comes first.
+    """
+    async with AsyncExitStack() as stack:
+        # Subscribe before reading the state, so completion cannot slip in between.
+        events = await stack.enter_async_context(JobSubscription(pubsub, key)) if wait else None
+        job = await jobs.get(key)
+        if job is None:
+            raise HTTPException(status_code=404, detail={"status": "unknown"})
+
+        if job.state in PENDING_STATES and events is not None:
+            if await events.wait_until_finished(wait) is not None:
+                job = await jobs.get(key) or job
+
+    etag = f'"{key}-{job.task_id}-{job.state}"'
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if job.state == DONE:
+        # Stored as JSON already; pass it through instead of re-encoding.
+        return Response(job.result, media_type="application/json", headers=headers)
+    return JSONResponse(job_status(key, job), headers=headers)
+
+def sse_event(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+@app.get("/jobs/{key}/events")
+async def job_events(key: str):
+    """
+    Server-Sent Events for a job: its current state first (named after it:
+    "accepted", "running", "done" or "failed"), then "running" and
+    "progress" events as the job advances, and a final "done" (the same
+    body as GET /jobs/{key}) or "failed" event, after which the stream ends.
+    """
+    job = await jobs.get(key)
+    if job is None:
         raise HTTPException(status_code=404, detail={"status": "unknown"})
-    return {"status": "inflight"}
+
+    async def stream():
+        nonlocal job
+        async with JobSubscription(pubsub, key) as events:
+            if job.state in PENDING_STATES:
+                # Read again now that we are subscribed, so completion cannot slip in between.
+                job = await jobs.get(key) or job
+            if job.state == DONE:
+                yield sse_event(DONE, job.result.decode())
+                return
+            yield sse_event(job.state, json.dumps(job_status(key, job)))
+            if job.state == FAILED:
+                return
+            deadline = time.monotonic() + SSE_MAX_DURATION
+            while time.monotonic() < deadline:
+                event = await events.next(min(SSE_HEARTBEAT, deadline - time.monotonic()))
+                if event is None:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield sse_event(event["status"], json.dumps(event))
+                if event["status"] in TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: stop nginx-style proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Bytes read per chunk when streaming stored results
+RESULT_CHUNK_SIZE = 64 * 1024
+
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The inclusive (first, last) byte positions of a single-range "bytes="
+    Range header, or None to send the whole body. Raises 416 if the range
+    cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        # Absent, another unit, or multiple ranges: ignore and send everything.
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+def stream_range(open_body, size: int, byte_range: Optional[Tuple[int, int]], headers: dict) -> StreamingResponse:
+    """Stream `open_body()` (a seekable binary file), or the requested range of it."""
+    start, end = byte_range or (0, size - 1)
+    headers = {**headers, "Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    def chunks():
+        with open_body() as body:
+            body.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = body.read(min(RESULT_CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+    return StreamingResponse(
+        chunks(),
+        status_code=206 if byte_range is not None else 200,
+        media_type="application/json",
+        headers=headers,
+    )
+
+@app.get("/jobs/{key}/result")
+async def get_job_result(
+    key: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    The result body of a finished job, streamed with single-range support.
+
+    Large results live gzip-compressed in the result store. Clients that
+    accept gzip get the stored bytes as-is (Content-Encoding: gzip, ranges
+    over the compressed bytes); others get them decompressed on the fly.
+    The two representations have their own ETags, so a range (If-Range)
+    is never resumed against the other one.
+    """
+    job = await jobs.get(key)
+    if job is None or job.state != DONE:
+        raise HTTPException(status_code=404, detail={"status": job.state if job else "unknown"})
+    meta = json.loads(job.result)
+    if "result_url" not in meta:
+        body = json.dumps(meta.get("result")).encode()
+        return stream_range(
+            lambda: io.BytesIO(body),
+            len(body),
+            parse_byte_range(range_header, len(body)),
+            {"Cache-Control": "no-cache"},
+        )
+
+    try:
+        result_store.open(key).close()
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Result has expired")
+
+    def respond(open_body, size: int, etag: str, headers: dict) -> StreamingResponse:
+        # If-Range: resume only if the client holds this very representation.
+        if if_range is not None and if_range.strip() != etag:
+            byte_range = None
+        else:
+            byte_range = parse_byte_range(range_header, size)
+        headers = {**headers, "ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        return stream_range(open_body, size, byte_range, headers)
+
+    if "gzip" in (accept_encoding or ""):
+        return respond(
+            lambda: result_store.open(key),
+            meta["stored_size"],
+            f'"{meta["digest"]}-gz"',
+            {"Content-Encoding": "gzip"},
+        )
+    return respond(
+        lambda: result_store.open(key, decompress=True),
+        meta["size"],
+        f'"{meta["digest"]}"',
+        {},
+    )
+
+def client_time(value: str, timezone_offset: int) -> datetime:
+    """parse_client_time(), answering 422 for a malformed timestamp like the bulk endpoints."""
+    try:
+        return parse_client_time(value, timezone_offset)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
 @app.put('/add_exception/{booking_id}/', response_model=BookingSchema)
-def add_exception(booking_id: int, data: ExceptionCreate, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
+async def add_exception(booking_id: int, data: ExceptionCreate, db: AsyncSession = Depends(get_async_db)):
+    local_time = client_time(data.exception_date, data.timezoneOffset)
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
 
-    local_dt = datetime.strptime(data.exception_date, '%Y-%m-%dT%H:%M:%S.%fZ')
-    offset = timedelta(minutes=data.timezoneOffset)
-    local_time = local_dt - offset
+    async with booking_conflicts.locked(db, booking.psychologist_id) as schedule:
+        await schedule.check([local_time], exclude=booking.id)
 
-    if booking.exceptions is None:
-        booking.exceptions = []
-    booking.exceptions.append(local_time.isoformat())
-    db.commit()
-    db.refresh(booking)
+        if local_time not in booking.exception_dates:
+            booking.exception_rows.append(BookingException(occurrence_date=local_time))
+        await db.run_sync(add_exception_occurrence, booking, local_time)
+        await db.commit()
+    await schedule_cache.invalidate(booking.psychologist_id)
     return booking
 
 @app.post('/book', status_code=201, response_model=BookingSchema)
-def book_time(data: BookingCreate, db: Session = Depends(get_db)):
-    client = Client(name=data.client_name)
-    db.add(client)
-    db.commit()
-    db.refresh(client)
-
-    local_dt = datetime.strptime(data.date_time, '%Y-%m-%dT%H:%M:%S.%fZ')
-    offset = timedelta(minutes=data.timezoneOffset)
-    date_time = local_dt - offset
+async def book_time(data: BookingCreate, db: AsyncSession = Depends(get_async_db)):
+    date_time = client_time(data.date_time, data.timezoneOffset)
 
     new_booking = Booking(
-        client_id=client.id,
         psychologist_id=data.psychologist_id,
         date_time=date_time,
         is_recurring=data.is_recurring
     )
-    db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
+    async with booking_conflicts.locked(db, data.psychologist_id) as schedule:
+        # Check before anything is written so a rejected booking leaves no client behind.
+        await schedule.check(planned_sessions(new_booking), series=booking_series(new_booking))
+
+        # Client, booking and occurrences go out in one transaction. The flush
+        # gets the new ids back via RETURNING where the backend supports it,
+        # and the session keeps the objects loaded after commit, so nothing
+        # is read back.
+        new_booking.client = Client(name=data.client_name)
+        db.add(new_booking)
+        await db.flush()
+        await db.run_sync(add_occurrences, new_booking)
+        await db.commit()
+    await schedule_cache.invalidate(data.psychologist_id)
     return new_booking
 
 @app.put('/approve/{booking_id}', response_model=BookingSchema)
-def approve_booking(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
+async def approve_booking(booking_id: int, db: AsyncSession = Depends(get_async_db)):
+    if UPDATE_RETURNING:
+        # One round trip: update the row and get it back.
+        booking = await db.scalar(
+            update(Booking)
+            .where(Booking.id == booking_id)
+            .values(status='Approved')
+            .returning(Booking)
+        )
+    else:
+        booking = await db.get(Booking, booking_id)
+        if booking:
+            booking.status = 'Approved'
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
-    booking.status = 'Approved'
-    db.commit()
-    db.refresh(booking)
+    await db.commit()
+    await schedule_cache.invalidate(booking.psychologist_id)
     return booking
 
 @app.put('/modify/{booking_id}', response_model=BookingSchema)
-def modify_booking(booking_id: int, data: BookingUpdate, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
+async def modify_booking(booking_id: int, data: BookingUpdate, db: AsyncSession = Depends(get_async_db)):
+    date_time = client_time(data.newDateTime, data.timezoneOffset)
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
-
-    local_dt = datetime.strptime(data.newDateTime, '%Y-%m-%dT%H:%M:%S.%fZ')
-    offset = timedelta(minutes=data.timezoneOffset)
-    booking.date_time = local_dt - offset
-    booking.status = 'Pending'
-    db.commit()
-    db.refresh(booking)
+    async with booking_conflicts.locked(db, booking.psychologist_id) as schedule:
+        booking.date_time = date_time
+        try:
+            await schedule.check(planned_sessions(booking), exclude=booking.id, series=booking_series(booking))
+        except BookingConflict:
+            await db.rollback()
+            raise
+
+        booking.status = 'Pending'
+        await db.run_sync(rebuild_occurrences, booking)
+        await db.commit()
+    await schedule_cache.invalidate(booking.psychologist_id)
     return booking
 
 @app.delete('/cancel/{booking_id}')
-def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
+async def cancel_booking(booking_id: int, db: AsyncSession = Depends(get_async_db)):
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
 
-    db.delete(booking)
-    db.commit()
+    psychologist_id = booking.psychologist_id
+    async with booking_conflicts.locked(db, psychologist_id):
+        db.add(BookingCancellation(
+            booking_id=booking.id,
+            psychologist_id=psychologist_id,
+            date_time=booking.date_time,
+            is_recurring=booking.is_recurring,
+            status=booking.status,
+        ))
+        await db.run_sync(delete_occurrences, booking.id)
+        await db.delete(booking)
+        await db.commit()
+    await schedule_cache.invalidate(psychologist_id)
     return {"message": "Booking canceled"}
 
+# Largest number of rows a single bulk request may carry
+MAX_BULK_ROWS = 5000
+
+booking_create_adapter = TypeAdapter(BookingCreate)
+
+async def read_batch(request: Request) -> list:
+    """
+    Parse a bulk request body: a JSON array, or NDJSON (one JSON value per
+    line) when the Content-Type says so.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            rows = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed JSON/NDJSON body")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON")
+    if len(rows) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} rows per request")
+    return rows
+
+def batch_ids(rows: list) -> Tuple[List[int], List[dict]]:
+    """Booking ids from a batch of ints or {"id": ...} objects, plus per-row errors."""
+    ids, errors = [], []
+    for i, row in enumerate(rows):
+        value = row.get("id") if isinstance(row, dict) else row
+        if isinstance(value, int) and not isinstance(value, bool):
+            ids.append(value)
+        else:
+            errors.append({"index": i, "error": "Expected a booking id"})
+    return ids, errors
+
+@app.post('/bookings/bulk')
+async def bulk_book(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Create many bookings in one transaction.
+
+    Rows are validated individually (schema, timestamp, psychologist, overlap
+    with existing bookings and with earlier rows of the batch). Valid rows are
+    inserted with two multi-row INSERTs (clients, then bookings) plus one for
+    their occurrences; invalid rows are reported by index and skipped.
+    """
+    rows = await read_batch(request)
+    errors = []
+    validated = []
+    for i, row in enumerate(rows):
+        try:
+            validated.append((i, booking_create_adapter.validate_python(row)))
+        except ValidationError as exc:
+            errors.append({"index": i, "error": json.loads(exc.json(include_url=False))})
+
+    valid = []
+    timestamps = parse_timestamps((data.date_time for _, data in validated), return_exceptions=True)
+    for (i, data), timestamp in zip(validated, timestamps):
+        if isinstance(timestamp, ValueError):
+            errors.append({"index": i, "error": str(timestamp)})
+            continue
+        valid.append((i, data, to_client_time(timestamp, data.timezoneOffset)))
+
+    known_psychologists = set(await db.scalars(
+        select(Psychologist.id).where(Psychologist.id.in_({data.psychologist_id for _, data, _ in valid}))
+    ))
+
+    accepted = []
+    async with AsyncExitStack() as stack:
+        # Lock psychologists in a fixed order so concurrent batches cannot
+        # deadlock, and load each schedule once for the whole batch.
+        indexes = {}
+        for psychologist_id in sorted(known_psychologists):
+            schedule = await stack.enter_async_context(booking_conflicts.locked(db, psychologist_id))
+            indexes[psychologist_id] = await schedule.load()
+        # Rows of this batch accepted so far, materialized like the stored bookings
+        pending = {
+            psychologist_id: IntervalIndex([], index.covers_until) for psychologist_id, index in indexes.items()
+        }
+
+        for i, data, date_time in valid:
+            if data.psychologist_id not in known_psychologists:
+                errors.append({"index": i, "error": "Psychologist not found"})
+                continue
+            booking = Booking(
+                psychologist_id=data.psychologist_id,
+                date_time=date_time,
+                is_recurring=data.is_recurring,
+            )
+            sessions = planned_sessions(booking)
+            series = booking_series(booking)
+            conflicts = indexes[data.psychologist_id].conflicts(sessions, series=series)
+            earlier_rows = pending[data.psychologist_id].conflicts(sessions, series=series)
+            if conflicts or earlier_rows:
+                errors.append({
+                    "index": i,
+                    "error": "Requested time overlaps an existing booking",
+                    "conflicting_booking_ids": sorted(conflicts),
+                    "conflicting_rows": sorted(earlier_rows),
+                })
+                continue
+            pending[data.psychologist_id].replace(i, sessions, series)
+            accepted.append((data, booking, sessions))
+
+        if accepted:
+            client_ids = (await db.scalars(
+                insert(Client).returning(Client.id, sort_by_parameter_order=True),
+                [{"name": data.client_name} for data, _, _ in accepted],
+            )).all()
+            booking_ids = (await db.scalars(
+                insert(Booking).returning(Booking.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "client_id": client_id,
+                        "psychologist_id": booking.psychologist_id,
+                        "date_time": booking.date_time,
+                        "is_recurring": booking.is_recurring,
+                        "status": "Pending",
+                    }
+                    for client_id, (_, booking, _) in zip(client_ids, accepted)
+                ],
+            )).all()
+            occurrences = [
+                {
+                    "booking_id": booking_id,
+                    "psychologist_id": booking.psychologist_id,
+                    "start_time": start,
+                    "end_time": start + SESSION_DURATION,
+                    "is_exception": False,
+                }
+                for booking_id, (_, booking, sessions) in zip(booking_ids, accepted)
+                for start in sessions
+            ]
+            # Series starting past the horizon have no sessions yet, and an
+            # executemany with no rows would insert one row of defaults.
+            if occurrences:
+                await db.execute(insert(BookingOccurrence), occurrences)
+            await db.commit()
+
+            for client_id, booking_id, (_, booking, _) in zip(client_ids, booking_ids, accepted):
+                booking.id = booking_id
+                booking.client_id = client_id
+                booking.status = "Pending"
+
+    for psychologist_id in {booking.psychologist_id for _, booking, _ in accepted}:
+        await schedule_cache.invalidate(psychologist_id)
+
+    errors.sort(key=lambda error: error["index"])
+    return {
+        "created": len(accepted),
+        "bookings": [
+            BookingSchema.model_validate(booking, from_attributes=True).model_dump(mode="json")
+            for _, booking, _ in accepted
+        ],
+        "errors": errors,
+    }
+
+@app.post('/bookings/bulk/approve')
+async def bulk_approve(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Approve many bookings with a single UPDATE; unknown ids are reported."""
+    ids, errors = batch_ids(await read_batch(request))
+    if UPDATE_RETURNING:
+        # One round trip: update the rows and get them back.
+        updated = (await db.execute(
+            update(Booking)
+            .where(Booking.id.in_(ids))
+            .values(status='Approved')
+            .returning(Booking.id, Booking.psychologist_id)
+        )).all()
+    else:
+        updated = (await db.execute(
+            select(Booking.id, Booking.psychologist_id).where(Booking.id.in_(ids))
+        )).all()
+        await db.execute(
+            update(Booking)
+            .where(Booking.id.in_([booking_id for booking_id, _ in updated]))
+            .values(status='Approved')
+        )
+    await db.commit()
+
+    for psychologist_id in {psychologist_id for _, psychologist_id in updated}:
+        await schedule_cache.invalidate(psychologist_id)
+
+    found = {booking_id for booking_id, _ in updated}
+    errors += [{"id": booking_id, "error": "Booking not found"} for booking_id in ids if booking_id not in found]
+    return {"approved": sorted(found), "errors": errors}
+
+@app.post('/bookings/bulk/cancel')
+async def bulk_cancel(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Cancel many bookings in one transaction; unknown ids are reported."""
+    ids, errors = batch_ids(await read_batch(request))
+    owners = dict((await db.execute(
+        select(Booking.id, Booking.psychologist_id).where(Booking.id.in_(ids))
+    )).all())
+
+    async with AsyncExitStack() as stack:
+        for psychologist_id in sorted(set(owners.values())):
+            await stack.enter_async_context(booking_conflicts.locked(db, psychologist_id))
+        if owners:
+            await db.execute(insert(BookingCancellation).from_select(
+                ["booking_id", "psychologist_id", "date_time", "is_recurring", "status", "canceled_at"],
+                select(
+                    Booking.id, Booking.psychologist_id, Booking.date_time, Booking.is_recurring,
+                    Booking.status, literal(datetime.now(), DateTime),
+                ).where(Booking.id.in_(owners)),
+            ))
+            await db.execute(delete(BookingOccurrence).where(BookingOccurrence.booking_id.in_(owners)))
+            await db.execute(delete(BookingException).where(BookingException.booking_id.in_(owners)))
+            await db.execute(delete(Booking).where(Booking.id.in_(owners)))
+            await db.commit()
+
+    for psychologist_id in set(owners.values()):
+        await schedule_cache.invalidate(psychologist_id)
+
+    errors += [{"id": booking_id, "error": "Booking not found"} for booking_id in ids if booking_id not in owners]
+    return {"canceled": sorted(owners), "errors": errors}
+
+# Largest page a single schedule request may ask for
+MAX_SCHEDULE_PAGE_SIZE = 1000
+
+def schedule_etag(psychologist_id: int, version: Optional[int], cache_key: str) -> Optional[str]:
+    """
+    Strong ETag for a schedule/availability response: the psychologist's
+    change version plus a digest of the query, so it is known without
+    loading or hashing the body. None when the version is unavailable.
+    """
+    if version is None:
+        return None
+    digest = hashlib.blake2s(cache_key.encode(), digest_size=6).hexdigest()
+    return f'"{psychologist_id}-{version}-{digest}"'
+
+def encode_schedule_cursor(booking: Booking) -> str:
+    """Opaque keyset cursor pointing just after `booking`."""
+    raw = f"{booking.date_time.isoformat()}|{booking.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_schedule_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_time, booking_id = raw.split("|")
+        return datetime.fromisoformat(date_time), int(booking_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# BookingSchema's columns, in its field order
+SCHEDULE_COLUMNS = (
+    Booking.date_time, Booking.is_recurring, Booking.id, Booking.status, Booking.client_id, Booking.psychologist_id,
+)
+# Booking ids per exception lookup, well below SQLite's bound parameter limit
+EXCEPTION_LOOKUP_BATCH = 500
+
+def booking_range_filters(start: Optional[datetime], end: Optional[datetime]) -> list:
+    """
+    Conditions for bookings that occur in [start, end). Recurring series
+    that began before `start` are included.
+    """
+    filters = []
+    if start is not None:
+        filters.append(or_(Booking.date_time >= start, Booking.is_recurring))
+    if end is not None:
+        filters.append(Booking.date_time < end)
+    return filters
+
+def load_schedule(
+    db: Session,
+    psychologist_id: int,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[Tuple[datetime, int]],
+    limit: Optional[int],
+) -> Tuple[list, Optional[str]]:
+    """
+    Query one page of a schedule as plain rows of SCHEDULE_COLUMNS; returns
+    the rows and the next cursor.
+    """
+    query = select(*SCHEDULE_COLUMNS).where(
+        Booking.psychologist_id == psychologist_id, *booking_range_filters(start, end)
+    )
+    if after is not None:
+        query = query.where(tuple_(Booking.date_time, Booking.id) > tuple_(*after))
+    query = query.order_by(Booking.date_time, Booking.id)
+
+    if limit is None:
+        return db.execute(query).all(), None
+
+    rows = db.execute(query.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_schedule_cursor(rows[-1])
+    return rows, None
+
+def load_exception_dates(db: Session, booking_ids: List[int]) -> Dict[int, List[datetime]]:
+    """Rescheduled session times of the given bookings, in order (as Booking.exception_dates)."""
+    exceptions = defaultdict(list)
+    for i in range(0, len(booking_ids), EXCEPTION_LOOKUP_BATCH):
+        batch = booking_ids[i:i + EXCEPTION_LOOKUP_BATCH]
+        rows = db.execute(
+            select(BookingException.booking_id, BookingException.occurrence_date)
+            .where(BookingException.booking_id.in_(batch))
+            .order_by(BookingException.booking_id, BookingException.occurrence_date)
+        )
+        for booking_id, occurrence_date in rows:
+            exceptions[booking_id].append(occurrence_date)
+    return exceptions
+
+def schedule_items(rows: list, exceptions: Dict[int, List[datetime]]) -> List[dict]:
+    """BookingSchema dicts for schedule `rows`, in its field order."""
+    return [
+        {
+            "date_time": date_time,
+            "is_recurring": is_recurring,
+            "id": booking_id,
+            "status": status,
+            "client_id": client_id,
+            "psychologist_id": psychologist_id,
+            # Booking.exceptions: ISO strings, or None when there are none
+            "exceptions": [dt.isoformat() for dt in exceptions[booking_id]] if booking_id in exceptions else None,
+        }
+        for date_time, is_recurring, booking_id, status, client_id, psychologist_id in rows
+    ]
+
+def render_schedule(db: Session, rows: list) -> bytes:
+    """
+    The JSON of List[BookingSchema] for schedule `rows`, byte for byte, but
+    encoded straight from the column tuples with orjson: no ORM objects and
+    no model validation per row.
+    """
+    exceptions = load_exception_dates(db, [row.id for row in rows])
+    return orjson.dumps(schedule_items(rows, exceptions))
+
 @app.get('/schedule/{psychologist_id}', response_model=List[BookingSchema])
-def get_schedule(psychologist_id: int, db: Session = Depends(get_db)):
-    bookings = db.query(Booking).filter(Booking.psychologist_id == psychologist_id).all()
-    return bookings
+async def get_schedule(
+    psychologist_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_SCHEDULE_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Bookings for a psychologist, ordered by (date_time, id).
+
+    - start/end: only return bookings that occur in [start, end). Recurring
+      series that began before `start` are still included.
+    - limit/cursor: keyset pagination. When more rows remain, the cursor for
+      the next page is returned in the X-Next-Cursor header.
+
+    Serialized pages are served from the schedule cache. Responses carry an
+    ETag; a matching If-None-Match is answered with 304 before any database
+    work.
+    """
+    after = decode_schedule_cursor(cursor) if cursor is not None else None
+    cache_key = f"schedule:{start}:{end}:{cursor}:{limit}"
+    version = await schedule_cache.version(psychologist_id)
+    etag = schedule_etag(psychologist_id, version, cache_key)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    async def render():
+        def load(sync_db: Session):
+            rows, next_cursor = load_schedule(sync_db, psychologist_id, start, end, after, limit)
+            return render_schedule(sync_db, rows), next_cursor
+
+        body, next_cursor = await db.run_sync(load)
+        entry = {"body": body}
+        if next_cursor is not None:
+            entry["next_cursor"] = next_cursor.encode()
+        return entry
+
+    entry = await schedule_cache.get_or_compute(psychologist_id, cache_key, render, version=version)
+    headers = {}
+    if etag is not None:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+    if "next_cursor" in entry:
+        headers["X-Next-Cursor"] = entry["next_cursor"].decode()
+    return Response(entry["body"], media_type="application/json", headers=headers)
+
+# Rows fetched from the server-side cursor per round trip during exports
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def encode_ndjson(items: List[dict]) -> bytes:
+    return b"".join(orjson.dumps(item) + b"\n" for item in items)
+
+def encode_csv(items: List[dict]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for item in items:
+        writer.writerow([
+            # Same timestamps as the JSON formats
+            item["date_time"].isoformat(),
+            item["is_recurring"],
+            item["id"],
+            item["status"],
+            item["client_id"],
+            item["psychologist_id"],
+            " ".join(item["exceptions"] or ()),
+        ])
+    return out.getvalue().encode()
+
+@app.get('/export/bookings')
+async def export_bookings(
+    psychologist_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+):
+    """
+    All bookings matching the filters, ordered by (date_time, id) and
+    streamed as NDJSON (one BookingSchema object per line) or CSV (with a
+    header; exceptions space-separated).
+
+    start/end filter as in /schedule. Rows are read from a server-side
+    cursor EXPORT_BATCH_SIZE at a time and written out batch by batch, so
+    memory stays flat however many bookings are exported.
+    """
+    query = select(*SCHEDULE_COLUMNS).where(*booking_range_filters(start, end))
+    if psychologist_id is not None:
+        query = query.where(Booking.psychologist_id == psychologist_id)
+    query = query.order_by(Booking.date_time, Booking.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    encode = encode_csv if export_format == "csv" else encode_ndjson
+
+    async def stream():
+        if export_format == "csv":
+            yield (",".join(BookingSchema.model_fields) + "\n").encode()
+        # A session of its own: dependency sessions are closed before the
+        # response body is sent.
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                exceptions = await db.run_sync(load_exception_dates, [row.id for row in rows])
+                yield encode(schedule_items(rows, exceptions))
+
+    headers = {"Content-Disposition": f'attachment; filename="bookings.{export_format}"'}
+    return StreamingResponse(stream(), media_type=EXPORT_FORMATS[export_format], headers=headers)
+
+# Upper bound on the range a single availability request may cover
+MAX_AVAILABILITY_DAYS = 92
+
+def load_sessions(
+    db: Session, psychologist_id: int, range_start: datetime, range_end: datetime
+) -> List[datetime]:
+    """Booked session start times in [range_start, range_end)."""
+    if range_end <= ensure_horizon(db):
+        return db.scalars(
+            select(BookingOccurrence.start_time).where(
+                BookingOccurrence.psychologist_id == psychologist_id,
+                BookingOccurrence.start_time >= range_start,
+                BookingOccurrence.start_time < range_end,
+            )
+        ).all()
+
+    bookings = (
+        db.query(Booking)
+        .filter(Booking.psychologist_id == psychologist_id)
+        .filter(
+            or_(
+                Booking.exception_rows.any(
+                    (BookingException.occurrence_date >= range_start)
+                    & (BookingException.occurrence_date < range_end)
+                ),
+                (Booking.date_time < range_end)
+                & (Booking.is_recurring | (Booking.date_time >= range_start)),
+            )
+        )
+        .all()
+    )
+    return [
+        session
+        for booking in bookings
+        for session in expand_booking(booking, range_start, range_end)
+    ]
+
+@app.get('/availability/{psychologist_id}', response_model=List[AvailabilitySlot])
+async def get_availability(
+    psychologist_id: int,
+    from_date: date = Query(..., alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Free session slots for a psychologist between `from` and `to` (inclusive).
+
+    Sessions are read from the materialized `booking_occurrence` table.
+    Ranges beyond its rolling horizon fall back to expanding the bookings
+    that can touch the range. Results are served from the schedule cache and
+    revalidated with the same ETags as /schedule.
+    """
+    if to_date is None:
+        to_date = from_date
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (to_date - from_date).days >= MAX_AVAILABILITY_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range must not exceed {MAX_AVAILABILITY_DAYS} days",
+        )
+
+    cache_key = f"availability:{from_date}:{to_date}"
+    version = await schedule_cache.version(psychologist_id)
+    etag = schedule_etag(psychologist_id, version, cache_key)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    async def render():
+        range_start, range_end = lookup_range(from_date, to_date)
+        sessions = await db.run_sync(load_sessions, psychologist_id, range_start, range_end)
+        slots = [
+            {"start": start, "end": end}
+            for start, end in free_slots(sessions, from_date, to_date)
+        ]
+        return {"body": slot_list_adapter.dump_json(slot_list_adapter.validate_python(slots))}
+
+    entry = await schedule_cache.get_or_compute(psychologist_id, cache_key, render, version=version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag is not None else {}
+    return Response(entry["body"], media_type="application/json", headers=headers)
 
 @app.on_event("startup")
 def startup_event():
     # Create all tables
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add indexes
+    # introduced after the table was first created explicitly.
+    for index in Booking.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    add_schedule_version(engine)
 
     with Session(engine) as session:
         # Check if a Psychologist already exists
@@ -409,3 +1240,19 @@ def startup_event():
             new_psychologist = Psychologist(name="Dr. Alex")
             session.add(new_psychologist)
             session.commit()
+
+        # Move exceptions out of the old JSON column before they are expanded.
+        migrate_legacy_exceptions(session)
+
+        # Materialize booking occurrences up to the rolling horizon,
+        # backfilling bookings written before the table existed.
+        ensure_horizon(session)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Close pooled Redis and database connections on the loop that opened them.
+    await async_redis_client.connection_pool.disconnect()
+    await async_pubsub_client.connection_pool.disconnect()
+    await async_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,52 @@
+"""
+Data migrations run at startup.
+
+The schema itself is created by `Base.metadata.create_all`; these functions
+add the columns it cannot add to existing tables and move existing rows into
+it. Each one is idempotent and cheap once there is nothing left to migrate.
+"""
+from datetime import datetime
+
+from sqlalchemy import String, cast, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import Booking, BookingException
+
+
+def add_schedule_version(engine: Engine) -> bool:
+    """
+    Add `psychologist.schedule_version` to databases created before it
+    existed. Returns whether the column was added.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("psychologist")}
+    if "schedule_version" in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE psychologist ADD COLUMN schedule_version INTEGER NOT NULL DEFAULT 0"))
+    return True
+
+
+def migrate_legacy_exceptions(db: Session) -> int:
+    """
+    Move exceptions from the old `booking.exceptions` JSON column into
+    `booking_exception`, clearing the column as each booking is migrated.
+    Returns the number of bookings migrated.
+    """
+    bookings = db.scalars(
+        select(Booking).where(
+            Booking.legacy_exceptions.isnot(None),
+            # Earlier versions of this migration cleared the column to JSON null.
+            cast(Booking.legacy_exceptions, String) != "null",
+        )
+    ).all()
+    for booking in bookings:
+        existing = set(booking.exception_dates)
+        for value in booking.legacy_exceptions:
+            dt = datetime.fromisoformat(value)
+            if dt not in existing:
+                booking.exception_rows.append(BookingException(occurrence_date=dt))
+                existing.add(dt)
+        booking.legacy_exceptions = None
+    db.commit()
+    return len(bookings)
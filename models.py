@@ -0,0 +1,112 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import String, ForeignKey, DateTime, Boolean, Index, Integer, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.dialects.postgresql import JSON
+
+from database import Base
+
+
+# SQLAlchemy Models
+class Psychologist(Base):
+    __tablename__ = "psychologist"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(30))
+    # Bumped by every write to the psychologist's bookings (see conflicts.py)
+    schedule_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    bookings: Mapped[list["Booking"]] = relationship("Booking", back_populates="psychologist")
+
+class Client(Base):
+    __tablename__ = "client"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(30))
+    booking: Mapped["Booking"] = relationship("Booking", back_populates="client")
+
+class Booking(Base):
+    __tablename__ = "booking"
+    __table_args__ = (
+        # Serves the per-psychologist, time-ordered schedule queries
+        Index("ix_booking_psychologist_date_time", "psychologist_id", "date_time"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    date_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    is_recurring: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Superseded by booking_exception; only read by migrate_legacy_exceptions().
+    # None is stored as SQL NULL, not the JSON text 'null'.
+    legacy_exceptions: Mapped[Optional[list]] = mapped_column("exceptions", JSON(none_as_null=True), nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default='Pending')
+    client_id: Mapped[int] = mapped_column(ForeignKey("client.id"), unique=True)
+    client: Mapped["Client"] = relationship("Client", back_populates="booking")
+    psychologist_id: Mapped[int] = mapped_column(ForeignKey("psychologist.id"))
+    psychologist: Mapped["Psychologist"] = relationship("Psychologist", back_populates="bookings")
+    # Loaded with the booking (one extra IN query per batch), so async
+    # handlers never trigger a lazy load.
+    exception_rows: Mapped[list["BookingException"]] = relationship(
+        "BookingException",
+        order_by="BookingException.occurrence_date",
+        lazy="selectin",
+        cascade="all, delete-orphan",
+    )
+
+    @property
+    def exception_dates(self) -> List[datetime]:
+        """Start times of the rescheduled sessions, in order."""
+        return [row.occurrence_date for row in self.exception_rows]
+
+    @property
+    def exceptions(self) -> Optional[List[str]]:
+        """Exceptions as ISO strings, the shape the API has always returned."""
+        return [dt.isoformat() for dt in self.exception_dates] or None
+
+class BookingException(Base):
+    """
+    A rescheduled session of a booking. It replaces the regular session of a
+    recurring series in the same (Sunday-based) week.
+    """
+    __tablename__ = "booking_exception"
+    __table_args__ = (
+        # Also serves the per-booking lookups
+        UniqueConstraint("booking_id", "occurrence_date"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"))
+    occurrence_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+class BookingOccurrence(Base):
+    """
+    One materialized session of a booking.
+
+    Recurring series are expanded up to a rolling horizon (see occurrences.py)
+    so range queries and conflict checks are plain indexed lookups.
+    """
+    __tablename__ = "booking_occurrence"
+    __table_args__ = (
+        Index("ix_booking_occurrence_psychologist_start", "psychologist_id", "start_time"),
+        UniqueConstraint("booking_id", "start_time"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    booking_id: Mapped[int] = mapped_column(ForeignKey("booking.id"), index=True)
+    psychologist_id: Mapped[int] = mapped_column(ForeignKey("psychologist.id"))
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # True for a rescheduled session coming from booking_exception
+    is_exception: Mapped[bool] = mapped_column(Boolean, default=False)
+
+class BookingCancellation(Base):
+    """
+    A canceled booking. Cancelling deletes the booking row, so this keeps
+    what reports need to count it afterwards.
+    """
+    __tablename__ = "booking_cancellation"
+    __table_args__ = (
+        Index("ix_booking_cancellation_canceled_at", "canceled_at"),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # No foreign key: the booking row is gone
+    booking_id: Mapped[int] = mapped_column(nullable=False)
+    psychologist_id: Mapped[int] = mapped_column(ForeignKey("psychologist.id"))
+    date_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    is_recurring: Mapped[bool] = mapped_column(Boolean, default=False)
+    status: Mapped[str] = mapped_column(String(20))
+    canceled_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,168 @@
+"""
+Materialized booking occurrences.
+
+Every session of a booking gets a row in `booking_occurrence`: one-off
+bookings and rescheduled exceptions always, recurring series up to a rolling
+horizon. The write endpoints keep the rows in step with `booking`, so readers
+can query sessions by (psychologist_id, start_time) instead of expanding
+every series on each request.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import case, delete, exists, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from availability import SESSION_DURATION, series_occurrences, week_key
+from models import Booking, BookingOccurrence
+
+# How far ahead recurring series are materialized
+OCCURRENCE_HORIZON = timedelta(days=int(os.getenv("OCCURRENCE_HORIZON_DAYS", "365")))
+
+# Extend the horizon once it has fallen this far behind
+HORIZON_SLACK = timedelta(days=1)
+
+# Upper bound of the rows currently materialized by this process
+_materialized_until: Optional[datetime] = None
+
+
+def horizon_end(now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.now()) + OCCURRENCE_HORIZON
+
+
+def _occurrence(booking: Booking, start: datetime, is_exception: bool = False) -> BookingOccurrence:
+    return BookingOccurrence(
+        booking_id=booking.id,
+        psychologist_id=booking.psychologist_id,
+        start_time=start,
+        end_time=start + SESSION_DURATION,
+        is_exception=is_exception,
+    )
+
+
+def build_occurrences(booking: Booking, start: datetime, until: datetime) -> List[BookingOccurrence]:
+    """Occurrence rows for the sessions of `booking` starting in [start, until)."""
+    rows = {
+        dt: _occurrence(booking, dt)
+        for dt in series_occurrences(booking, start, until)
+    }
+    for dt in booking.exception_dates:
+        # Exceptions are stored regardless of the horizon, like one-off bookings.
+        if dt >= start:
+            rows[dt] = _occurrence(booking, dt, is_exception=True)
+    return list(rows.values())
+
+
+def planned_sessions(booking: Booking) -> List[datetime]:
+    """
+    Session start times `rebuild_occurrences` would materialize for
+    `booking`. Works on unsaved bookings too, so writes can be checked
+    before anything is flushed.
+    """
+    return [row.start_time for row in build_occurrences(booking, datetime.min, _rebuild_until(booking))]
+
+
+def _rebuild_until(booking: Booking) -> datetime:
+    if booking.is_recurring:
+        return _materialized_until or horizon_end()
+    return datetime.max
+
+
+def delete_occurrences(db: Session, booking_id: int) -> None:
+    db.execute(delete(BookingOccurrence).where(BookingOccurrence.booking_id == booking_id))
+
+
+def add_occurrences(db: Session, booking: Booking) -> None:
+    """
+    Materialize the sessions of a booking that has none yet (a new one).
+    Unlike `rebuild_occurrences` this needs no DELETE; the caller commits.
+    """
+    db.add_all(build_occurrences(booking, datetime.min, _rebuild_until(booking)))
+
+
+def rebuild_occurrences(db: Session, booking: Booking) -> None:
+    """
+    Replace the occurrence rows of `booking`. Used when a booking is moved
+    (new bookings use `add_occurrences`); the caller commits.
+    """
+    delete_occurrences(db, booking.id)
+    db.add_all(build_occurrences(booking, datetime.min, _rebuild_until(booking)))
+
+
+def add_exception_occurrence(db: Session, booking: Booking, exception_dt: datetime) -> None:
+    """
+    Apply a newly added exception incrementally: drop the regular session of
+    that week and add the rescheduled one. The caller commits.
+    """
+    if booking.is_recurring:
+        week_start = datetime.combine(week_key(exception_dt), datetime.min.time())
+        db.execute(
+            delete(BookingOccurrence).where(
+                BookingOccurrence.booking_id == booking.id,
+                BookingOccurrence.is_exception.is_(False),
+                BookingOccurrence.start_time >= week_start,
+                BookingOccurrence.start_time < week_start + timedelta(weeks=1),
+            )
+        )
+    existing = db.scalar(
+        select(BookingOccurrence.id).where(
+            BookingOccurrence.booking_id == booking.id,
+            BookingOccurrence.start_time == exception_dt,
+        )
+    )
+    if existing is None:
+        db.add(_occurrence(booking, exception_dt, is_exception=True))
+
+
+def extend_horizon(db: Session, until: datetime) -> None:
+    """
+    Materialize recurring series up to `until`, appending only the sessions
+    after each series' last materialized one, and backfill bookings that have
+    no occurrence rows yet (e.g. rows written before this table existed).
+    """
+    # Last regular session per booking (NULL when only exceptions exist)
+    last_materialized = dict(
+        db.execute(
+            select(
+                BookingOccurrence.booking_id,
+                func.max(case((BookingOccurrence.is_exception.is_(False), BookingOccurrence.start_time))),
+            ).group_by(BookingOccurrence.booking_id)
+        ).all()
+    )
+    for booking in db.scalars(select(Booking).where(Booking.is_recurring)):
+        if booking.id not in last_materialized:
+            db.add_all(build_occurrences(booking, datetime.min, until))
+            continue
+        after = last_materialized[booking.id]
+        start = after + timedelta(microseconds=1) if after else datetime.min
+        db.add_all(_occurrence(booking, dt) for dt in series_occurrences(booking, start, until))
+
+    unmaterialized = select(Booking).where(
+        ~Booking.is_recurring,
+        ~exists().where(BookingOccurrence.booking_id == Booking.id),
+    )
+    for booking in db.scalars(unmaterialized):
+        db.add_all(build_occurrences(booking, datetime.min, datetime.max))
+
+
+def ensure_horizon(db: Session) -> datetime:
+    """
+    Keep the rolling horizon at least `OCCURRENCE_HORIZON` ahead of now.
+
+    This is a cheap comparison on most calls; the table is only extended
+    when the horizon has slipped by more than `HORIZON_SLACK`.
+    """
+    global _materialized_until
+    target = horizon_end()
+    if _materialized_until is None or target - _materialized_until > HORIZON_SLACK:
+        try:
+            extend_horizon(db, target)
+            db.commit()
+        except IntegrityError:
+            # Another process extended the same series concurrently;
+            # its rows are equivalent to ours.
+            db.rollback()
+        _materialized_until = target
+    return _materialized_until
@@ -21,7 +21,13 @@ const ClientBooking = () => {
   useEffect(() => {
     // Fetch all bookings for the psychologist (ID: 1 in this example)
     // eslint-disable-next-line react-hooks/exhaustive-deps
-    axios.get(`${API_BASE_URL}/schedule/1`)
+    // Only load bookings from today onwards (recurring series are always included)
+    const startOfToday = new Date();
+    startOfToday.setHours(0, 0, 0, 0);
+    const start = new Date(startOfToday.getTime() - startOfToday.getTimezoneOffset() * 60000)
+      .toISOString()
+      .slice(0, 19); // Local wall-clock time, as stored by the API
+    axios.get(`${API_BASE_URL}/schedule/1`, { params: { start } })
       .then(response => { 
         setBookings(response.data);
         return response.data;
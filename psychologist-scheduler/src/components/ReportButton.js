@@ -1,31 +1,44 @@
 import React, { useState, useRef } from "react";
 
 export default function ReportButton({ month = "2025-11", apiBase = "http://localhost:5000" }) {
-  const [status, setStatus] = useState("idle");      // idle | inflight | accepted | done | error
+  const [status, setStatus] = useState("idle");      // idle | inflight | accepted | running | done | error
   const [result, setResult] = useState(null);
   const [pollUrl, setPollUrl] = useState(null);
-  const timerRef = useRef(null);
+  const [progress, setProgress] = useState(null);
+  const sourceRef = useRef(null);
+  const stoppedRef = useRef(false);
 
   const cleanup = () => {
-    if (timerRef.current) {
-      clearInterval(timerRef.current);
-      timerRef.current = null;
+    stoppedRef.current = true;
+    if (sourceRef.current) {
+      sourceRef.current.close();
+      sourceRef.current = null;
     }
   };
 
-  const startPoll = (url) => {
-    cleanup();
-    timerRef.current = setInterval(async () => {
+  // Large results are not inlined in the job status; fetch them from result_url.
+  const showResult = async (data) => {
+    if (!data.result && data.result_url) {
+      const res = await fetch(apiBase + data.result_url);
+      data = { ...data, result: await res.json() };
+    }
+    setStatus("done");
+    setResult(data);
+  };
+
+  // Fallback without EventSource: long-poll, each request held until the job
+  // finishes or 30 seconds pass.
+  const longPoll = async (url) => {
+    while (!stoppedRef.current) {
       try {
-        const res = await fetch(apiBase + url);
+        const res = await fetch(`${apiBase}${url}?wait=30`);
         const data = await res.json();
-        // If the response has a 'result' key, the job is done.
-        if (data.result) {
-          setStatus("done");
-          setResult(data);
+        // If the response has a 'result' (or 'result_url') key, the job is done.
+        if (data.result || data.result_url) {
           cleanup();
-        } else if (data.status === "inflight") {
-          // Status is already 'inflight' or 'accepted', no need to set it again.
+          await showResult(data);
+        } else if (data.status === "accepted" || data.status === "running") {
+          setStatus(data.status);
         } else {
           setStatus("error");
           cleanup();
@@ -34,12 +47,45 @@ export default function ReportButton({ month = "2025-11", apiBase = "http://loca
         setStatus("error");
         cleanup();
       }
-    }, 1200); // Poll every 1.2 seconds
+    }
+  };
+
+  // The server pushes progress and the result as soon as they are ready.
+  const startEvents = (url) => {
+    cleanup();
+    stoppedRef.current = false;
+    if (!window.EventSource) {
+      longPoll(url);
+      return;
+    }
+    const source = new EventSource(`${apiBase}${url}/events`);
+    sourceRef.current = source;
+    source.addEventListener("running", () => setStatus("running"));
+    source.addEventListener("progress", (e) => {
+      const data = JSON.parse(e.data);
+      setProgress(`${data.chunks_done}/${data.chunks}`);
+    });
+    source.addEventListener("done", (e) => {
+      cleanup();
+      showResult(JSON.parse(e.data));
+    });
+    source.addEventListener("failed", () => {
+      setStatus("error");
+      cleanup();
+    });
+    // Transient errors are retried by EventSource itself; give up only once it has.
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        setStatus("error");
+        cleanup();
+      }
+    };
   };
 
   const handleClick = async () => {
     setStatus("inflight");
     setResult(null);
+    setProgress(null);
 
     const idemKey = crypto.randomUUID();   // Browser-native UUID generator
     try {
@@ -53,16 +99,15 @@ export default function ReportButton({ month = "2025-11", apiBase = "http://loca
       });
       const data = await res.json();
 
-      if (res.status === 202 && (data.status === "accepted" || data.status === "inflight")) {
+      if (res.status === 202 && (data.status === "accepted" || data.status === "running")) {
         setStatus(data.status);
         if (data.poll) {
           setPollUrl(data.poll);
-          startPoll(data.poll);
+          startEvents(data.poll);
         }
       } else if (data.status === "done" || data.result) {
         // If already cached, return immediately
-        setStatus("done");
-        setResult(data);
+        await showResult(data);
       } else {
         setStatus("error");
       }
@@ -74,12 +119,13 @@ export default function ReportButton({ month = "2025-11", apiBase = "http://loca
   return (
     <div style={{ padding: 12, border: "1px dashed #ccc", borderRadius: 8, marginTop: 12 }}>
       <div style={{ display: "flex", gap: 8, alignItems: "center", marginBottom: 8 }}>
-        <button onClick={handleClick} disabled={status === "inflight" || status === "accepted"}>
+        <button onClick={handleClick} disabled={["inflight", "accepted", "running"].includes(status)}>
           Generate "{month}" Report (Background Task)
         </button>
         <span>Status: {status}</span>
       </div>
-      {pollUrl && <div style={{ fontSize: 12, color: "#666" }}>Polling: {pollUrl}</div>}
+      {pollUrl && <div style={{ fontSize: 12, color: "#666" }}>Following: {pollUrl}/events</div>}
+      {progress && status !== "done" && <div style={{ fontSize: 12, color: "#666" }}>Chunks done: {progress}</div>}
       {result && (
         <pre style={{ background: "#f7f7f7", padding: 10, borderRadius: 6, overflowX: "auto" }}>
 {JSON.stringify(result, null, 2)}
@@ -1,21 +1,36 @@
 import React, { useState, useEffect} from 'react';
+import axios from 'axios';
 import Calendar from 'react-calendar'; // Install with `npm install react-calendar`
 //import 'react-calendar/dist/Calendar.css';
 import './TimePicker.css'; // Custom styles for the time grid
 import 'react-datepicker/dist/react-datepicker.css';
-import { generateAvailability } from './availabilityUtils';
 
-const TimePicker = ({ onDateTimeChange, bookings }) => {
+// Format a Date as YYYY-MM-DD in local time (the API stores local wall-clock times)
+const toLocalDateString = (date) => {
+  const pad = (n) => n.toString().padStart(2, '0');
+  return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+};
+
+const TimePicker = ({ onDateTimeChange, bookings, psychologistId = 1 }) => {
   const [selectedDate, setSelectedDate] = useState(new Date());
   const [selectedTime, setSelectedTime] = useState(null);
   const [availability, setAvailability] = useState([]);
+  const API_BASE_URL = process.env.REACT_APP_API_BASE_URL;
+
   useEffect(() => {
-    // 当 bookings 或 selectedDate 变化时，重新计算 availability
-    setAvailability(generateAvailability(selectedDate, bookings));
-  }, [bookings, selectedDate]);  
+    // 当 bookings 或 selectedDate 变化时，从服务器重新获取 availability
+    const day = toLocalDateString(selectedDate);
+    axios.get(`${API_BASE_URL}/availability/${psychologistId}`, { params: { from: day } })
+      .then(response => {
+        setAvailability(response.data.map(slot => {
+          const start = new Date(slot.start);
+          return { hour: start.getHours(), minute: start.getMinutes(), available: true };
+        }));
+      })
+      .catch(error => console.error(error));
+  }, [API_BASE_URL, bookings, psychologistId, selectedDate]);
   const handleDateChange = (date) => {
-    setSelectedDate(date);
-    setAvailability(generateAvailability(date, bookings)); // Update availability when date changes
+    setSelectedDate(date); // Availability is refetched by the effect above
     setSelectedTime(null); // Reset time when date changes
   };
 
@@ -1,8 +1,17 @@
 #!/bin/sh
 set -e
 
+# Metrics from the worker's child processes and from the API are written
+# under here and aggregated on scrape. Each gets its own directory, so the
+# API's /metrics and the worker's exporter do not report each other's
+# samples; start from empty directories.
+METRICS_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$METRICS_DIR"
+mkdir -p "$METRICS_DIR/api" "$METRICS_DIR/worker"
+
 # 1) Start Celery worker in background
-python -m celery -A tasks.reporting:celery_app worker -l info -Q reports,default &
+PROMETHEUS_MULTIPROC_DIR="$METRICS_DIR/worker" \
+    python -m celery -A tasks.reporting:celery_app worker -l info -Q reports,default &
 
 # If your Celery app is defined elsewhere, adjust:
 #   python -m celery -A tasks.worker:celery_app worker -l info -Q reports,default &
@@ -10,4 +19,5 @@ python -m celery -A tasks.reporting:celery_app worker -l info -Q reports,default
 #   python -m celery -A tasks.reporting:celery worker -l info -Q reports,default &
 
 # 2) Start FastAPI with uvicorn in foreground
+export PROMETHEUS_MULTIPROC_DIR="$METRICS_DIR/api"
 uvicorn main:app --host 0.0.0.0 --port 8000
@@ -1,22 +1,248 @@
-import os, time, json, redis
+import os, time, json
+import inspect
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from celery import chord
+
+from sqlalchemy import case, distinct, func, select
+from sqlalchemy.orm import Session
+
 from .worker import celery_app
+from database import SessionLocal
+from models import Booking, BookingCancellation, BookingOccurrence, Psychologist
+from occurrences import ensure_horizon
+from utils.job_events import publish_job_event
+from utils.jobs import DONE, FAILED, PENDING_TTL, RUNNING, JobStore
+from utils.redis_clients import redis_client
+from utils.result_store import RESULT_INLINE_MAX_BYTES, RESULT_TTL, result_store
 from utils.tracing import task_log_extra 
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-r = redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
+r = redis_client
+jobs = JobStore(r)
+
+# Result rows fetched per round trip while streaming aggregates
+REPORT_YIELD_PER = int(os.getenv("REPORT_YIELD_PER", "1000"))
+# Psychologists per subtask; reports covering more are fanned out
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "50"))
+# How long finished chunk partials are kept for a retry to resume from
+CHECKPOINT_TTL = 3600
+
+
+class ReportTask(celery_app.Task):
+    """
+    Report tasks mark their job failed, and tell its subscribers, once
+    Celery gives up on them (after all retries). The key can then be
+    claimed again by a new POST /reports.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        idem_key = inspect.signature(self.run).bind(*args, **kwargs).arguments["idem_key"]
+        pipe = r.pipeline()
+        jobs.transition(idem_key, FAILED, RESULT_TTL, client=pipe, error=str(exc))
+        publish_job_event(pipe, idem_key, {"status": FAILED, "key": idem_key, "error": str(exc)})
+        pipe.execute()
+
+
+def month_range(month: Optional[str]) -> Tuple[datetime, datetime]:
+    """[start, end) of a "YYYY-MM" month; the current month if None."""
+    start = datetime.strptime(month, "%Y-%m") if month else datetime.now().replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def _empty_row(psychologist_id: int, name: Optional[str]) -> dict:
+    return {
+        "psychologist_id": psychologist_id,
+        "name": name,
+        "sessions": 0,
+        "bookings": 0,
+        "approved_sessions": 0,
+        "approval_rate": None,
+        "recurring_sessions": 0,
+        "one_off_sessions": 0,
+        "rescheduled_sessions": 0,
+        "cancellations": 0,
+    }
+
+
+def aggregate_report(
+    db: Session, start: datetime, end: datetime, psychologist_ids: Optional[Tuple[int, int]] = None
+) -> dict:
+    """
+    Per-psychologist counts over [start, end): sessions, approved, recurring
+    vs one-off and rescheduled sessions, and cancellations, optionally for
+    psychologists with ids in the inclusive `psychologist_ids` range only.
+
+    Counting happens in the database (GROUP BY over the indexed
+    booking_occurrence.start_time and booking_cancellation.canceled_at
+    ranges) and the per-psychologist rows are streamed with yield_per, so
+    memory grows with the number of psychologists, not of sessions.
+
+    Returns a partial report: {"psychologists", "rows_scanned", "complete"}.
+    Partials for disjoint psychologist ranges can be concatenated.
+    """
+    covered_until = ensure_horizon(db)
+
+    sessions = (
+        select(
+            BookingOccurrence.psychologist_id,
+            Psychologist.name,
+            func.count().label("sessions"),
+            func.count(distinct(BookingOccurrence.booking_id)).label("bookings"),
+            func.sum(case((Booking.status == 'Approved', 1), else_=0)).label("approved"),
+            func.sum(case((Booking.is_recurring, 1), else_=0)).label("recurring"),
+            func.sum(case((BookingOccurrence.is_exception, 1), else_=0)).label("rescheduled"),
+        )
+        .join(Booking, Booking.id == BookingOccurrence.booking_id)
+        .join(Psychologist, Psychologist.id == BookingOccurrence.psychologist_id)
+        .where(BookingOccurrence.start_time >= start, BookingOccurrence.start_time < end)
+        .group_by(BookingOccurrence.psychologist_id, Psychologist.name)
+    )
+    cancellations = (
+        select(BookingCancellation.psychologist_id, Psychologist.name, func.count().label("cancellations"))
+        .join(Psychologist, Psychologist.id == BookingCancellation.psychologist_id)
+        .where(BookingCancellation.canceled_at >= start, BookingCancellation.canceled_at < end)
+        .group_by(BookingCancellation.psychologist_id, Psychologist.name)
+    )
+    if psychologist_ids is not None:
+        sessions = sessions.where(BookingOccurrence.psychologist_id.between(*psychologist_ids))
+        cancellations = cancellations.where(BookingCancellation.psychologist_id.between(*psychologist_ids))
+
+    rows = {}
+    rows_scanned = 0
+    for row in db.execute(sessions.execution_options(yield_per=REPORT_YIELD_PER)):
+        entry = rows[row.psychologist_id] = _empty_row(row.psychologist_id, row.name)
+        entry.update(
+            sessions=row.sessions,
+            bookings=row.bookings,
+            approved_sessions=row.approved,
+            approval_rate=round(row.approved / row.sessions, 4),
+            recurring_sessions=row.recurring,
+            one_off_sessions=row.sessions - row.recurring,
+            rescheduled_sessions=row.rescheduled,
+        )
+        rows_scanned += row.sessions
+    for row in db.execute(cancellations.execution_options(yield_per=REPORT_YIELD_PER)):
+        entry = rows.get(row.psychologist_id)
+        if entry is None:
+            entry = rows[row.psychologist_id] = _empty_row(row.psychologist_id, row.name)
+        entry["cancellations"] = row.cancellations
+        rows_scanned += row.cancellations
+
+    return {
+        "psychologists": [rows[psychologist_id] for psychologist_id in sorted(rows)],
+        "rows_scanned": rows_scanned,
+        # Recurring series are only materialized up to the rolling horizon.
+        "complete": end <= covered_until,
+    }
+
+
+def summarize_report(start: datetime, end: datetime, partials: List[dict]) -> dict:
+    """Merge partial reports (see aggregate_report) into the final report."""
+    psychologists = sorted(
+        (entry for partial in partials for entry in partial["psychologists"]),
+        key=lambda entry: entry["psychologist_id"],
+    )
+    totals = {
+        key: sum(entry[key] for entry in psychologists)
+        for key in (
+            "sessions", "bookings", "approved_sessions", "recurring_sessions",
+            "one_off_sessions", "rescheduled_sessions", "cancellations",
+        )
+    }
+    totals["approval_rate"] = (
+        round(totals["approved_sessions"] / totals["sessions"], 4) if totals["sessions"] else None
+    )
+    return {
+        "month": start.strftime("%Y-%m"),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "complete": all(partial["complete"] for partial in partials),
+        "totals": totals,
+        "psychologists": psychologists,
+    }
+
+
+def psychologist_chunks(db: Session, size: int) -> List[Tuple[int, int]]:
+    """Inclusive id ranges covering all psychologists, `size` per range."""
+    ids = db.scalars(select(Psychologist.id).order_by(Psychologist.id)).all()
+    return [(ids[i], ids[min(i + size, len(ids)) - 1]) for i in range(0, len(ids), size)]
+
+
+def checkpoint_key(idem_key: str) -> str:
+    # Hash of finished chunk partials, field "{first_id}-{last_id}"
+    return f"report:{idem_key}:chunks"
+
+
+def finish_report(idem_key: str, report: dict) -> dict:
+    """
+    Mark the job done with the report as its result, notify the job's
+    subscribers (the same dict as a "done" event) and clean up.
+
+    Small reports are stored inline. Larger ones go to the result store and
+    the job only holds their metadata and a `result_url` to fetch them from.
+    """
+    body = json.dumps(report).encode()
+    if len(body) <= RESULT_INLINE_MAX_BYTES:
+        result = {
+            "status": "done",
+            "key": idem_key,
+            "result": report,
+        }
+    else:
+        result = {
+            "status": "done",
+            "key": idem_key,
+            "result_url": f"/jobs/{idem_key}/result",
+            **result_store.save(idem_key, body),
+        }
+        result_store.purge(RESULT_TTL)
+    pipe = r.pipeline()
+    # ✅ Write result back to Redis (expires in 1 hour)
+    jobs.transition(idem_key, DONE, RESULT_TTL, client=pipe, result=json.dumps(result))
+    publish_job_event(pipe, idem_key, result)
+    # ✅ Clean any checkpoints
+    pipe.delete(checkpoint_key(idem_key))
+    pipe.execute()
+    return result
+
 
 @celery_app.task(name="tasks.reporting.generate_report",
+                 base=ReportTask,
                  bind=True,
                  autoretry_for=(Exception,),
+                 dont_autoretry_for=(ValueError,),  # a bad month will not fix itself
                  retry_backoff=True,
                  retry_kwargs={"max_retries": 3})
 def generate_report(self, request_id: str, idem_key: str, payload: dict) -> dict:
+    """
+    Build the monthly report. Up to REPORT_CHUNK_SIZE psychologists it is
+    computed right here; beyond that it is fanned out as a chord of
+    report_chunk tasks (one per id range) reduced by merge_report, which
+    finishes the job when every chunk has finished.
+    """
     # Record start time for latency measurement (in ms).
     start = time.time()
 
+    # Claimed jobs move to running. Anything else is a stale delivery (the
+    # job already finished or failed for good), so there is nothing to do.
+    state = jobs.transition(idem_key, RUNNING, PENDING_TTL)
+    if state not in (RUNNING, None):
+        logger.warning(
+            "report_task_skipped",
+            extra=task_log_extra(request_id, task_id=self.request.id, idem_key=idem_key, status=state),
+        )
+        return {"status": state, "key": idem_key}
+    if state == RUNNING and not self.request.retries:
+        publish_job_event(r, idem_key, {"status": RUNNING, "key": idem_key})
+
     # Log the task start with correlation IDs.
     logger.info(
         "report_task_started",
@@ -28,21 +254,34 @@ def generate_report(self, request_id: str, idem_key: str, payload: dict) -> dict
         ),
     )
 
+    rows_scanned = 0
     try:
-        # Simulate a time-consuming operation
-        time.sleep(2)
+        month_start, month_end = month_range(payload.get("month"))
+        month = month_start.strftime("%Y-%m")
+        with SessionLocal() as db:
+            chunks = psychologist_chunks(db, REPORT_CHUNK_SIZE)
+            if len(chunks) <= 1:
+                partial = aggregate_report(db, month_start, month_end)
 
-        # Build fake result (later you can save to DB)
-        result = {
-            "status": "done",
-            "key": idem_key,
-            "result": {"items": 3, "month": payload.get("month")},
-        }
+        if len(chunks) > 1:
+            chord(
+                report_chunk.s(request_id, idem_key, month, first_id, last_id, len(chunks))
+                for first_id, last_id in chunks
+            )(merge_report.s(request_id, idem_key, month, start))
+            logger.info(
+                "report_task_fanned_out",
+                extra=task_log_extra(
+                    request_id,
+                    task_id=self.request.id,
+                    idem_key=idem_key,
+                    chunks=len(chunks),
+                    retries=self.request.retries,
+                ),
+            )
+            return {"status": "fanned_out", "key": idem_key, "chunks": len(chunks)}
 
-        # ✅ Write result back to Redis (expires in 1 hour)
-        r.setex(f"done:{idem_key}", 3600, json.dumps(result))
-        # ✅ Clean inflight marker
-        r.delete(f"inflight:{idem_key}")
+        rows_scanned = partial["rows_scanned"]
+        result = finish_report(idem_key, summarize_report(month_start, month_end, [partial]))
 
         # Compute duration in milliseconds.
         duration_ms = round((time.time() - start) * 1000, 2)
@@ -55,6 +294,7 @@ def generate_report(self, request_id: str, idem_key: str, payload: dict) -> dict
                 task_id=self.request.id,
                 idem_key=idem_key,
                 duration_ms=duration_ms,
+                rows_scanned=rows_scanned,
                 status="success",
                 retries=self.request.retries,
             ),
@@ -82,3 +322,84 @@ def generate_report(self, request_id: str, idem_key: str, payload: dict) -> dict
 
         # Re-raise so Celery can handle retries according to our config.
         raise
+
+
+@celery_app.task(name="tasks.reporting.report_chunk",
+                 base=ReportTask,
+                 bind=True,
+                 autoretry_for=(Exception,),
+                 retry_backoff=True,
+                 retry_kwargs={"max_retries": 3})
+def report_chunk(
+    self, request_id: str, idem_key: str, month: str, first_id: int, last_id: int, chunks: Optional[int] = None
+) -> dict:
+    """
+    Partial report for psychologists first_id..last_id. Finished partials
+    are checkpointed in Redis, so when the report is retried or requested
+    again, chunks that already ran are not computed twice. Each finished
+    chunk publishes a progress event (chunks_done out of `chunks`).
+    """
+    start = time.time()
+    chunk = f"{first_id}-{last_id}"
+    saved = r.hget(checkpoint_key(idem_key), chunk)
+    if saved is not None:
+        partial = json.loads(saved)
+        chunks_done = r.hlen(checkpoint_key(idem_key))
+    else:
+        month_start, month_end = month_range(month)
+        with SessionLocal() as db:
+            partial = aggregate_report(db, month_start, month_end, (first_id, last_id))
+        pipe = r.pipeline()
+        pipe.hset(checkpoint_key(idem_key), chunk, json.dumps(partial))
+        pipe.expire(checkpoint_key(idem_key), CHECKPOINT_TTL)
+        pipe.hlen(checkpoint_key(idem_key))
+        chunks_done = pipe.execute()[-1]
+    publish_job_event(r, idem_key, {
+        "status": "progress",
+        "key": idem_key,
+        "chunks_done": chunks_done,
+        "chunks": chunks,
+    })
+
+    logger.info(
+        "report_chunk_finished",
+        extra=task_log_extra(
+            request_id,
+            task_id=self.request.id,
+            idem_key=idem_key,
+            chunk=chunk,
+            resumed=saved is not None,
+            duration_ms=round((time.time() - start) * 1000, 2),
+            rows_scanned=partial["rows_scanned"],
+            retries=self.request.retries,
+        ),
+    )
+    return partial
+
+
+@celery_app.task(name="tasks.reporting.merge_report",
+                 base=ReportTask,
+                 bind=True,
+                 autoretry_for=(Exception,),
+                 retry_backoff=True,
+                 retry_kwargs={"max_retries": 3})
+def merge_report(self, partials: List[dict], request_id: str, idem_key: str, month: str, started_at: float) -> dict:
+    """Chord callback: merge the chunk partials and publish the report."""
+    month_start, month_end = month_range(month)
+    result = finish_report(idem_key, summarize_report(month_start, month_end, partials))
+
+    logger.info(
+        "report_task_finished",
+        extra=task_log_extra(
+            request_id,
+            task_id=self.request.id,
+            idem_key=idem_key,
+            chunks=len(partials),
+            # From the original request, including time spent queued
+            duration_ms=round((time.time() - started_at) * 1000, 2),
+            rows_scanned=sum(partial["rows_scanned"] for partial in partials),
+            status="success",
+            retries=self.request.retries,
+        ),
+    )
+    return result
@@ -1,14 +1,34 @@
 # tasks/worker.py
 import os
+import time
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, task_retry, worker_init, worker_process_shutdown
+from prometheus_client import multiprocess, start_http_server
 import ssl
 
+from utils.metrics import CELERY_TASK_DURATION, CELERY_TASK_RETRIES, MULTIPROCESS, metrics_registry
+
 from utils.logging_config import setup_logging
+from utils.redis_clients import (
+    REDIS_CONNECT_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL, REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT, REDIS_URL,
+)
 setup_logging()
 
-redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+redis_url = REDIS_URL
 celery_app = Celery("govhealth", broker=redis_url, backend=redis_url)
 
+# Same Redis connection settings as utils/redis_clients.py, for the result
+# backend and the broker.
+celery_app.conf.redis_max_connections = REDIS_MAX_CONNECTIONS
+celery_app.conf.redis_socket_timeout = REDIS_SOCKET_TIMEOUT
+celery_app.conf.redis_socket_connect_timeout = REDIS_CONNECT_TIMEOUT
+celery_app.conf.redis_backend_health_check_interval = REDIS_HEALTH_CHECK_INTERVAL
+celery_app.conf.broker_transport_options = {
+    "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+    "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+}
+
 celery_app.conf.task_default_queue = "default"
 celery_app.conf.task_routes = {"tasks.reporting.*": {"queue": "reports"}}
 celery_app.conf.worker_hijack_root_logger = False 
@@ -20,4 +40,36 @@ if redis_url and redis_url.startswith("rediss://"):
         "ssl_cert_reqs": ssl.CERT_NONE,  # 同上
     }
 
+# ---- Metrics ----
+# Task duration and retries for every task, via Celery signals. With the
+# prefork pool each child writes its samples to PROMETHEUS_MULTIPROC_DIR;
+# the main worker process serves the aggregate on CELERY_METRICS_PORT.
+_task_started = {}
+
+@task_prerun.connect
+def _record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+@task_retry.connect
+def _record_task_retry(sender=None, **kwargs):
+    CELERY_TASK_RETRIES.labels(sender.name).inc()
+
+@worker_init.connect
+def _serve_metrics(**kwargs):
+    port = os.getenv("CELERY_METRICS_PORT")
+    if not port:
+        return
+    start_http_server(int(port), registry=metrics_registry())
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid=None, **kwargs):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 from . import reporting  # ensure tasks are registered
\ No newline at end of file
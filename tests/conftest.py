@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# database reads DATABASE_URL at import; keep tests off the committed schedule.db.
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
@@ -0,0 +1,237 @@
+import math
+import random
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from availability import expand_booking, free_slots, lookup_range
+
+
+def js_week_number(dt: datetime) -> int:
+    """getWeekNumber() in availabilityUtils.js, for a local (naive) time."""
+    start_of_year = datetime(dt.year, 1, 1)
+    past_days_of_year = (dt - start_of_year) / timedelta(days=1)
+    return math.ceil((past_days_of_year + (start_of_year.weekday() + 1) % 7 + 1) / 7)
+
+
+def js_generate_availability(day: date, bookings: list) -> list:
+    """
+    availabilityUtils.generateAvailability(), line by line, on bookings as
+    /schedule serves them. Returns the free slot start times.
+    """
+    start = datetime.combine(day, time(9))
+    end = datetime.combine(day, time(18))
+    interval = timedelta(minutes=15)
+    duration = timedelta(minutes=60)
+    min_gap = duration
+
+    all_bookings = []
+    for booking in bookings:
+        booking_date = datetime.fromisoformat(booking["date_time"])
+        exceptions = [datetime.fromisoformat(value) for value in booking["exceptions"] or []]
+        if booking["is_recurring"]:
+            # setMonth(getMonth() + 1), rolling over like JS: 31 January -> 3 March
+            recurrence_end = datetime(day.year + day.month // 12, day.month % 12 + 1, 1) + timedelta(days=day.day - 1)
+            next_booking_date = booking_date
+            while next_booking_date < recurrence_end:
+                has_exception = any(
+                    exception.year == next_booking_date.year
+                    and js_week_number(exception) == js_week_number(next_booking_date)
+                    for exception in exceptions
+                )
+                if not has_exception:
+                    all_bookings.append(next_booking_date)
+                next_booking_date += timedelta(days=7)
+        else:
+            all_bookings.append(booking_date)
+        all_bookings.extend(exceptions)
+    sorted_bookings = sorted(all_bookings)
+
+    slots = []
+    slot = start
+    while slot < end:
+        slot_end = slot + duration
+        if slot_end > end:
+            break
+        has_overlap = any(
+            (slot <= booking_time < slot_end) or (booking_time + duration > slot and booking_time <= slot)
+            for booking_time in sorted_bookings
+        )
+        is_available = not has_overlap and all(
+            slot - (booking_time + duration) >= min_gap or booking_time - slot_end >= min_gap
+            for booking_time in sorted_bookings
+        )
+        if is_available:
+            slots.append(slot)
+        slot += interval
+    return slots
+
+
+def server_slots(bookings: list, start_day: date, end_day: date) -> list:
+    """free_slots() over the expanded bookings, as /availability computes them."""
+    range_start, range_end = lookup_range(start_day, end_day)
+    sessions = [
+        session
+        for booking in bookings
+        for session in expand_booking(
+            SimpleNamespace(
+                date_time=datetime.fromisoformat(booking["date_time"]),
+                is_recurring=booking["is_recurring"],
+                exception_dates=[datetime.fromisoformat(value) for value in booking["exceptions"] or []],
+            ),
+            range_start,
+            range_end,
+        )
+    ]
+    return [slot_start for slot_start, _ in free_slots(sessions, start_day, end_day)]
+
+
+def js_slots(bookings: list, start_day: date, end_day: date) -> list:
+    days = (end_day - start_day).days + 1
+    return [slot for n in range(days) for slot in js_generate_availability(start_day + timedelta(days=n), bookings)]
+
+
+def booking(date_time: datetime, is_recurring: bool = False, exceptions=()) -> dict:
+    return {
+        "date_time": date_time.isoformat(),
+        "is_recurring": is_recurring,
+        "exceptions": [dt.isoformat() for dt in exceptions] or None,
+    }
+
+
+def random_bookings(rnd: random.Random, first_day: date, days: int) -> list:
+    """
+    One-off sessions anywhere, including off the 15-minute grid, just
+    outside working hours and on neighbouring days; weekly series that
+    started weeks earlier, some with rescheduled sessions.
+
+    Series and exceptions avoid Saturdays: see test_week_boundaries_differ_from_the_frontend.
+    """
+    def when(day_offset: int) -> datetime:
+        return datetime.combine(first_day, time(6)) + timedelta(days=day_offset, minutes=rnd.randrange(0, 15 * 60, 5))
+
+    def not_saturday(dt: datetime) -> datetime:
+        return dt + timedelta(days=1) if dt.weekday() == 5 else dt
+
+    bookings = [booking(when(rnd.randrange(-1, days + 1))) for _ in range(rnd.randrange(2 * days))]
+    for _ in range(rnd.randrange(4)):
+        first = not_saturday(when(rnd.randrange(-28, days)) - timedelta(weeks=rnd.randrange(5)))
+        exceptions = [
+            not_saturday(first + timedelta(weeks=rnd.randrange(8), days=rnd.randrange(-2, 3), hours=rnd.randrange(-2, 3)))
+            for _ in range(rnd.randrange(3))
+        ]
+        bookings.append(booking(first, True, exceptions))
+    return bookings
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_frontend_rules(seed):
+    rnd = random.Random(seed)
+    # Mid-year: the frontend numbers weeks per calendar year
+    first_day = date(2030, 3, 1) + timedelta(days=rnd.randrange(200))
+    days = rnd.randrange(1, 8)
+    bookings = random_bookings(rnd, first_day, days)
+    last_day = first_day + timedelta(days=days - 1)
+    assert server_slots(bookings, first_day, last_day) == js_slots(bookings, first_day, last_day)
+
+
+@pytest.mark.parametrize("bookings", [
+    # Sessions ending or starting exactly a gap away from the working day
+    [booking(datetime(2030, 6, 4, 7)), booking(datetime(2030, 6, 4, 19))],
+    [booking(datetime(2030, 6, 4, 7, 1)), booking(datetime(2030, 6, 4, 18, 59))],
+    # Late the day before and early the day after
+    [booking(datetime(2030, 6, 3, 23, 30)), booking(datetime(2030, 6, 5, 0, 15))],
+    # Off the grid, a gap apart
+    [booking(datetime(2030, 6, 4, 10, 7)), booking(datetime(2030, 6, 4, 13, 7))],
+    # Series, rescheduled across midnight into the next day
+    [booking(datetime(2030, 5, 7, 23, 30), True, [datetime(2030, 6, 5, 9, 30)])],
+])
+def test_day_boundaries(bookings):
+    days = (date(2030, 6, 4), date(2030, 6, 5))
+    assert server_slots(bookings, *days) == js_slots(bookings, *days)
+
+
+def test_rescheduled_session_replaces_its_week_only():
+    series = booking(datetime(2030, 5, 6, 10), True, [datetime(2030, 6, 5, 14)])  # Mondays
+    week = (date(2030, 6, 2), date(2030, 6, 8))
+    slots = server_slots([series], *week)
+    assert slots == js_slots([series], *week)
+    assert datetime(2030, 6, 3, 10) in slots  # Monday is free that week
+    assert datetime(2030, 6, 5, 14) not in slots  # Wednesday is taken
+    assert datetime(2030, 6, 10, 10) not in server_slots([series], date(2030, 6, 10), date(2030, 6, 10))
+
+
+def test_week_boundaries_differ_from_the_frontend():
+    """
+    The frontend's getWeekNumber() counts the time of day, so a Saturday
+    after midnight falls in the next week, and restarts at week 1 every
+    January. week_key() uses whole Sunday-to-Saturday weeks, so these
+    exceptions skip a different session than the frontend did.
+    """
+    saturday_exception = booking(datetime(2030, 5, 6, 10), True, [datetime(2030, 6, 8, 14)])  # Mondays
+    assert datetime(2030, 6, 3, 10) in server_slots([saturday_exception], date(2030, 6, 3), date(2030, 6, 3))
+    assert datetime(2030, 6, 10, 10) in js_slots([saturday_exception], date(2030, 6, 10), date(2030, 6, 10))
+
+    # Sunday 29 December 2030 to Saturday 4 January 2031 is one week here, two there.
+    new_year_exception = booking(datetime(2030, 12, 2, 10), True, [datetime(2031, 1, 2, 14)])  # Mondays
+    assert datetime(2030, 12, 30, 10) in server_slots([new_year_exception], date(2030, 12, 30), date(2030, 12, 30))
+    assert datetime(2030, 12, 30, 10) not in js_slots([new_year_exception], date(2030, 12, 30), date(2030, 12, 30))
+
+
+def iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def test_endpoint_matches_frontend_on_the_served_schedule():
+    """
+    GET /availability against generateAvailability() on the GET /schedule
+    payload the frontend used, after bookings, reschedules and cancellations.
+    """
+    from database import SessionLocal
+    from main import app
+    from models import Psychologist
+
+    rnd = random.Random(7)
+    # Inside the materialized horizon, starting on a Monday
+    first_day = date.today() + timedelta(days=60)
+    first_day -= timedelta(days=first_day.weekday())
+    with TestClient(app) as client:
+        with SessionLocal() as db:
+            psychologist = Psychologist(name="Dr. Availability")
+            db.add(psychologist)
+            db.commit()
+            psychologist_id = psychologist.id
+
+        booked = []
+        for i in range(60):
+            day = first_day + timedelta(days=rnd.randrange(-7, 14))
+            start = datetime.combine(day, time(8)) + timedelta(minutes=15 * rnd.randrange(44))
+            is_recurring = start.weekday() != 5 and rnd.random() < 0.2
+            response = client.post("/book", json={
+                "client_name": f"client {i}",
+                "psychologist_id": psychologist_id,
+                "date_time": iso(start),
+                "timezoneOffset": 0,
+                "is_recurring": is_recurring,
+            })
+            assert response.status_code in (201, 409), response.text
+            if response.status_code == 201:
+                booked.append(response.json())
+        for series in [b for b in booked if b["is_recurring"]][:3]:
+            moved = datetime.fromisoformat(series["date_time"]) + timedelta(weeks=1, days=1, hours=1)
+            response = client.put(f"/add_exception/{series['id']}/", json={
+                "exception_date": iso(moved), "timezoneOffset": 0,
+            })
+            assert response.status_code in (200, 409), response.text
+        for cancelled in rnd.sample(booked, len(booked) // 4):
+            assert client.delete(f"/cancel/{cancelled['id']}").status_code == 200
+
+        schedule = client.get(f"/schedule/{psychologist_id}").json()
+        last_day = first_day + timedelta(days=13)
+        response = client.get(f"/availability/{psychologist_id}", params={"from": first_day, "to": last_day})
+        assert response.status_code == 200
+
+    served = [datetime.fromisoformat(slot["start"]) for slot in response.json()]
+    assert served == js_slots(schedule, first_day, last_day)
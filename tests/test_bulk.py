@@ -0,0 +1,207 @@
+import json
+from datetime import date, datetime, time, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+# A Monday well inside the materialized horizon
+MONDAY = date.today() + timedelta(days=60 - date.today().weekday())
+
+
+@pytest.fixture
+def client():
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def psychologist_id(client):
+    from database import SessionLocal
+    from models import Psychologist
+
+    with SessionLocal() as db:
+        psychologist = Psychologist(name="Dr. Bulk")
+        db.add(psychologist)
+        db.commit()
+        return psychologist.id
+
+
+def iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def row(psychologist_id: int, dt: datetime, is_recurring: bool = False, name: str = "bulk") -> dict:
+    return {
+        "client_name": name,
+        "psychologist_id": psychologist_id,
+        "date_time": iso(dt),
+        "timezoneOffset": 0,
+        "is_recurring": is_recurring,
+    }
+
+
+def at(day: date, hour: int, minute: int = 0) -> datetime:
+    return datetime.combine(day, time(hour, minute))
+
+
+def bulk_book(client, rows: list) -> dict:
+    response = client.post("/bookings/bulk", json=rows)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def stored(booking_ids):
+    from database import SessionLocal
+    from models import Booking
+
+    with SessionLocal() as db:
+        return {
+            booking.id: booking.status
+            for booking in db.scalars(select(Booking).where(Booking.id.in_(booking_ids)))
+        }
+
+
+def test_bulk_book_reports_invalid_rows_and_inserts_the_rest(client, psychologist_id):
+    existing = client.post("/book", json=row(psychologist_id, at(MONDAY, 9))).json()
+    rows = [
+        row(psychologist_id, at(MONDAY, 12), name="ok"),
+        {"psychologist_id": psychologist_id, "date_time": iso(at(MONDAY, 14)), "timezoneOffset": 0},
+        {**row(psychologist_id, at(MONDAY, 15)), "date_time": "20300107T0800"},
+        row(psychologist_id + 1000, at(MONDAY, 15)),
+        row(psychologist_id, at(MONDAY, 9, 30)),
+        row(psychologist_id, at(MONDAY + timedelta(days=1), 10), is_recurring=True, name="series"),
+    ]
+    result = bulk_book(client, rows)
+
+    assert result["created"] == 2
+    assert [booking["date_time"] for booking in result["bookings"]] == [
+        at(MONDAY, 12).isoformat(), at(MONDAY + timedelta(days=1), 10).isoformat(),
+    ]
+    assert all(booking["status"] == "Pending" for booking in result["bookings"])
+    assert [error["index"] for error in result["errors"]] == [1, 2, 3, 4]
+    assert result["errors"][0]["error"][0]["loc"] == ["client_name"]
+    assert "Invalid ISO 8601 timestamp" in result["errors"][1]["error"]
+    assert result["errors"][2]["error"] == "Psychologist not found"
+    assert result["errors"][3]["conflicting_booking_ids"] == [existing["id"]]
+    assert result["errors"][3]["conflicting_rows"] == []
+
+    assert set(stored([booking["id"] for booking in result["bookings"]])) == {
+        booking["id"] for booking in result["bookings"]
+    }
+    # The series is materialized like a single booking's.
+    schedule = client.get(f"/schedule/{psychologist_id}").json()
+    assert len(schedule) == 3
+    slots = client.get(f"/availability/{psychologist_id}", params={"from": MONDAY + timedelta(weeks=5, days=1)}).json()
+    assert at(MONDAY + timedelta(weeks=5, days=1), 10).isoformat() not in [slot["start"] for slot in slots]
+
+
+def test_bulk_book_checks_rows_against_each_other(client, psychologist_id):
+    series_day = MONDAY + timedelta(days=2)
+    past_horizon = series_day + timedelta(weeks=60)
+    rows = [
+        row(psychologist_id, at(MONDAY, 10)),
+        row(psychologist_id, at(MONDAY, 10, 45)),
+        row(psychologist_id, at(MONDAY, 11)),
+        row(psychologist_id, at(past_horizon, 14, 30)),
+        row(psychologist_id, at(series_day, 14), is_recurring=True),
+        row(psychologist_id, at(series_day + timedelta(weeks=3), 13, 15)),
+    ]
+    result = bulk_book(client, rows)
+
+    assert [(error["index"], error["conflicting_booking_ids"], error["conflicting_rows"]) for error in result["errors"]] == [
+        (1, [], [0]),
+        # The series collides with a one-off far past the horizon...
+        (4, [], [3]),
+    ]
+    assert [booking["date_time"] for booking in result["bookings"]] == [
+        at(MONDAY, 10).isoformat(), at(MONDAY, 11).isoformat(), at(past_horizon, 14, 30).isoformat(),
+        # ...so the one-off in its fourth week is fine.
+        at(series_day + timedelta(weeks=3), 13, 15).isoformat(),
+    ]
+
+    # A second batch sees the first one's bookings.
+    again = bulk_book(client, [rows[2], rows[3]])
+    assert again["created"] == 0
+    assert [error["conflicting_rows"] for error in again["errors"]] == [[], []]
+    assert all(len(error["conflicting_booking_ids"]) == 1 for error in again["errors"])
+
+
+def test_bulk_book_reads_ndjson(client, psychologist_id):
+    body = "\n".join(json.dumps(row(psychologist_id, at(MONDAY, hour))) for hour in (9, 11, 13)) + "\n\n"
+    response = client.post("/bookings/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+
+
+@pytest.mark.parametrize("body, content_type, status", [
+    ("{not json", "application/json", 400),
+    ('{"a": 1}', "application/json", 400),
+    ('[1]\n{"a": ', "application/x-ndjson", 400),
+    (json.dumps([1, 2, 3]), "application/json", 413),
+])
+def test_bulk_bodies_are_rejected_whole(client, monkeypatch, body, content_type, status):
+    import main
+
+    monkeypatch.setattr(main, "MAX_BULK_ROWS", 2)
+    for url in ("/bookings/bulk", "/bookings/bulk/approve", "/bookings/bulk/cancel"):
+        response = client.post(url, content=body, headers={"Content-Type": content_type})
+        assert response.status_code == status, url
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_bulk_approve(client, psychologist_id, monkeypatch, update_returning):
+    import main
+
+    monkeypatch.setattr(main, "UPDATE_RETURNING", update_returning)
+    ids = [booking["id"] for booking in bulk_book(client, [
+        row(psychologist_id, at(MONDAY, hour)) for hour in (9, 11, 13)
+    ])["bookings"]]
+
+    response = client.post("/bookings/bulk/approve", json=[ids[0], {"id": ids[2]}, 10 ** 9, "x", {"id": True}])
+    assert response.status_code == 200
+    assert response.json() == {
+        "approved": [ids[0], ids[2]],
+        "errors": [
+            {"index": 3, "error": "Expected a booking id"},
+            {"index": 4, "error": "Expected a booking id"},
+            {"id": 10 ** 9, "error": "Booking not found"},
+        ],
+    }
+    assert stored(ids) == {ids[0]: "Approved", ids[1]: "Pending", ids[2]: "Approved"}
+
+    response = client.put(f"/approve/{ids[1]}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "Approved"
+    assert client.put(f"/approve/{10 ** 9}").status_code == 404
+    assert client.post("/bookings/bulk/approve", json=[]).json() == {"approved": [], "errors": []}
+
+
+def test_bulk_cancel(client, psychologist_id):
+    from database import SessionLocal
+    from models import BookingCancellation, BookingOccurrence
+
+    ids = [booking["id"] for booking in bulk_book(client, [
+        row(psychologist_id, at(MONDAY, 9)),
+        row(psychologist_id, at(MONDAY, 11), is_recurring=True),
+    ])["bookings"]]
+    assert client.put(f"/add_exception/{ids[1]}/", json={
+        "exception_date": iso(at(MONDAY + timedelta(weeks=1, days=1), 11)), "timezoneOffset": 0,
+    }).status_code == 200
+
+    response = client.post("/bookings/bulk/cancel", json=[{"id": ids[1]}, 10 ** 9, None])
+    assert response.status_code == 200
+    assert response.json() == {
+        "canceled": [ids[1]],
+        "errors": [{"index": 2, "error": "Expected a booking id"}, {"id": 10 ** 9, "error": "Booking not found"}],
+    }
+    assert set(stored(ids)) == {ids[0]}
+    with SessionLocal() as db:
+        cancellation = db.scalar(select(BookingCancellation).where(BookingCancellation.booking_id == ids[1]))
+        assert (cancellation.psychologist_id, cancellation.is_recurring) == (psychologist_id, True)
+        assert db.scalar(select(func.count()).where(BookingOccurrence.booking_id == ids[1])) == 0
+
+    # The series' slots are free again.
+    assert bulk_book(client, [row(psychologist_id, at(MONDAY + timedelta(weeks=2), 11))])["created"] == 1
@@ -0,0 +1,217 @@
+import asyncio
+import json
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+from utils.cache import VersionedCache
+from utils.jobs import DONE, RUNNING, AsyncJobStore, JobStore
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def cache(server):
+    return VersionedCache(fakeredis.aioredis.FakeRedis(server=server), "test", poll_interval=0.01)
+
+
+class Compute:
+    """An entry factory that counts its calls."""
+
+    def __init__(self, delay: float = 0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"body": f"computed {self.calls}".encode()}
+
+
+def test_invalidate_orphans_the_scope(cache):
+    async def run():
+        compute = Compute()
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 1"}
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 1"}
+        assert await cache.get_or_compute(2, "k", compute) == {"body": b"computed 2"}
+
+        version = await cache.version(1)
+        await cache.invalidate(1)
+        assert await cache.version(1) == version + 1
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 3"}
+        # Other scopes keep their entries.
+        assert await cache.get_or_compute(2, "k", compute) == {"body": b"computed 2"}
+        assert compute.calls == 3
+
+    asyncio.run(run())
+
+
+def test_versions_are_not_reused_after_data_loss(cache):
+    async def run():
+        await cache.invalidate(1)
+        version = await cache.version(1)
+        await cache.client.flushall()
+        assert await cache.version(1) > version
+
+    asyncio.run(run())
+
+
+def test_single_flight(cache):
+    async def run():
+        compute = Compute(delay=0.1)
+        entries = await asyncio.gather(*(cache.get_or_compute(1, "k", compute) for _ in range(10)))
+        assert compute.calls == 1
+        assert entries == [{"body": b"computed 1"}] * 10
+
+    asyncio.run(run())
+
+
+def test_failed_compute_releases_the_lock(cache):
+    async def run():
+        async def fail():
+            raise RuntimeError("database down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(1, "k", fail)
+        # The next caller recomputes at once instead of waiting for the lock.
+        started = monotonic()
+        assert await cache.get_or_compute(1, "k", Compute()) == {"body": b"computed 1"}
+        assert monotonic() - started < cache.wait_timeout
+
+    asyncio.run(run())
+
+
+def test_waiters_compute_themselves_after_the_timeout(cache):
+    async def run():
+        cache.wait_timeout = 0.05
+        slow = Compute(delay=0.3)
+        waiter = Compute()
+        first = asyncio.ensure_future(cache.get_or_compute(1, "k", slow))
+        await asyncio.sleep(0.01)
+        assert await cache.get_or_compute(1, "k", waiter) == {"body": b"computed 1"}
+        assert waiter.calls == 1
+        await first
+
+    asyncio.run(run())
+
+
+def test_bypass_while_redis_is_down(cache, server):
+    async def run():
+        compute = Compute()
+        server.connected = False
+        assert await cache.version(1) is None
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 1"}
+        assert cache._down_until > monotonic()
+
+        # Within retry_after, Redis is not tried again, even once it is back.
+        server.connected = True
+        assert await cache.version(1) is None
+        await cache.invalidate(1)
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 2"}
+        assert await cache.client.keys("*") == []
+
+        cache._down_until = 0.0
+        assert await cache.version(1) is not None
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 3"}
+        assert await cache.get_or_compute(1, "k", compute) == {"body": b"computed 3"}
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    import main
+
+    redis_client = fakeredis.aioredis.FakeRedis(server=server)
+    monkeypatch.setattr(main, "schedule_cache", VersionedCache(redis_client, "schedule"))
+    monkeypatch.setattr(main, "jobs", AsyncJobStore(redis_client))
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def psychologist_id(client):
+    from database import SessionLocal
+    from models import Psychologist
+
+    with SessionLocal() as db:
+        psychologist = Psychologist(name="Dr. Etag")
+        db.add(psychologist)
+        db.commit()
+        return psychologist.id
+
+
+def book(client, psychologist_id: int, day: date) -> None:
+    response = client.post("/book", json={
+        "client_name": "etag",
+        "psychologist_id": psychologist_id,
+        "date_time": datetime.combine(day, time(10)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "timezoneOffset": 0,
+    })
+    assert response.status_code == 201, response.text
+
+
+@pytest.mark.parametrize("path", ["/schedule/{id}", "/availability/{id}?from={day}"])
+def test_not_modified_until_a_booking_changes(client, psychologist_id, path):
+    day = date.today() + timedelta(days=30)
+    url = path.format(id=psychologist_id, day=day)
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get(url, headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    book(client, psychologist_id, day)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert client.get(url, headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_queries_have_their_own_etags(client, psychologist_id):
+    day = date.today() + timedelta(days=30)
+    etag = client.get(f"/availability/{psychologist_id}?from={day}").headers["ETag"]
+    other = client.get(f"/availability/{psychologist_id}?from={day + timedelta(days=1)}")
+    assert other.headers["ETag"] != etag
+    response = client.get(f"/availability/{psychologist_id}?from={day + timedelta(days=1)}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_no_etag_while_redis_is_down(client, psychologist_id, server):
+    server.connected = False
+    response = client.get(f"/schedule/{psychologist_id}", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.json() == []
+
+
+def test_job_not_modified_until_its_state_changes(client, server):
+    jobs = JobStore(fakeredis.FakeRedis(server=server))
+    jobs.claim("report-1", "task-1")
+    response = client.get("/jobs/report-1")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert client.get("/jobs/report-1", headers={"If-None-Match": etag}).status_code == 304
+
+    jobs.transition("report-1", RUNNING, 60)
+    response = client.get("/jobs/report-1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {"status": RUNNING, "key": "report-1"}
+
+    result = json.dumps({"status": DONE, "key": "report-1", "url": "/jobs/report-1/result"})
+    jobs.transition("report-1", DONE, 60, result=result)
+    response = client.get("/jobs/report-1", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.content == result.encode()
+    assert client.get("/jobs/report-1", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
@@ -0,0 +1,188 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import occurrences
+from availability import RECURRENCE_STEP, SESSION_DURATION, week_key
+from conflicts import BookingConflict, IntervalIndex, Series, booking_series, build_index, load_index
+from database import Base
+from models import Booking, BookingException, Client, Psychologist
+from occurrences import add_occurrences, planned_sessions
+
+# A Monday, 9:00
+FIRST = datetime(2030, 1, 7, 9)
+# Ten regular sessions are materialized: FIRST up to FIRST + 9 weeks
+HORIZON = FIRST + 9 * RECURRENCE_STEP + timedelta(minutes=30)
+
+
+def series_index(skipped=(), entries=()):
+    """Booking 1, a weekly series from FIRST, materialized up to HORIZON, plus `entries`."""
+    series = Series(FIRST, frozenset(skipped))
+    sessions = [
+        (FIRST + week * RECURRENCE_STEP, 1) for week in range(10)
+        if week_key(FIRST + week * RECURRENCE_STEP) not in series.skipped_weeks
+    ]
+    return IntervalIndex(sessions + list(entries), HORIZON, [(1, series)])
+
+
+def week(n, **offset):
+    return FIRST + n * RECURRENCE_STEP + timedelta(**offset)
+
+
+def test_series_overlaps():
+    series = Series(FIRST, frozenset())
+    assert series.overlaps(week(3))
+    assert series.overlaps(week(3, minutes=59))
+    assert series.overlaps(week(3, minutes=-59))
+    assert not series.overlaps(week(3, minutes=60))
+    assert not series.overlaps(week(3, minutes=-60))
+    assert not series.overlaps(week(3, days=1))
+    # Nothing before the first session
+    assert not series.overlaps(week(-1))
+    assert series.overlaps(week(0, minutes=-30))
+
+
+def test_series_skipped_weeks():
+    # Exceptions skip the regular session of their (Sunday-based) week.
+    series = Series(FIRST, frozenset({week_key(week(12))}))
+    assert not series.overlaps(week(12))
+    assert series.overlaps(week(11))
+    assert series.overlaps(week(13))
+
+
+@pytest.mark.parametrize("other, collides", [
+    (week(5), True),
+    (week(-3, minutes=30), True),
+    (week(2, minutes=-59), True),
+    (week(2, minutes=60), False),
+    (week(2, minutes=-60), False),
+    (week(2, days=3), False),
+    # A day apart, across the (Sunday) week boundary
+    (week(1, days=-1), False),
+    (week(-1, minutes=-30), True),
+])
+def test_series_collides_with(other, collides):
+    assert Series(FIRST, frozenset()).collides_with(Series(other, frozenset())) is collides
+    assert Series(other, frozenset()).collides_with(Series(FIRST, frozenset())) is collides
+
+
+def test_conflicts_before_the_horizon_use_the_stored_sessions():
+    index = series_index(skipped={week_key(week(3))})
+    assert index.conflicts([week(2, minutes=30)]) == {1}
+    assert index.conflicts([week(2, minutes=60)]) == set()
+    # The skipped week has no stored session, and the series is not consulted.
+    assert index.conflicts([week(3)]) == set()
+
+
+def test_conflicts_at_the_horizon_boundary():
+    index = series_index()
+    # The last stored session starts just before the horizon.
+    assert index.conflicts([week(9, minutes=-59)]) == {1}
+    # Week 10 is not stored: a session ending exactly at the horizon is checked
+    # against stored sessions only, one ending after it against the series.
+    assert index.conflicts([HORIZON - SESSION_DURATION]) == {1}
+    assert index.conflicts([week(10, minutes=-30)]) == {1}
+    assert index.conflicts([week(10, minutes=-60)]) == set()
+    assert index.conflicts([week(40)]) == {1}
+    assert index.conflicts([week(40, days=1)]) == set()
+
+
+def test_conflicts_past_the_horizon_skip_skipped_weeks():
+    index = series_index(skipped={week_key(week(12))})
+    assert index.conflicts([week(12)]) == set()
+    assert index.conflicts([week(13)]) == {1}
+
+
+def test_new_series_against_one_off_sessions_past_the_horizon():
+    one_off = (week(30, days=2, minutes=15), 2)
+    index = series_index(entries=[one_off])
+    new_series = Series(week(0, days=2), frozenset())
+    # Its stored sessions (up to the horizon) are clear; week 30 is not.
+    stored = [week(n, days=2) for n in range(9)]
+    assert index.conflicts(stored, series=new_series) == {2}
+    # Skipping that week clears it.
+    skipped = Series(new_series.first, frozenset({week_key(week(30, days=2))}))
+    assert index.conflicts(stored, series=skipped) == set()
+    # A one-off session stored before the horizon is only checked via `starts`.
+    index = series_index(entries=[(week(5, days=2, minutes=15), 2)])
+    assert index.conflicts(stored, series=new_series) == {2}
+    assert index.conflicts([], series=new_series) == set()
+
+
+def test_new_series_against_other_series():
+    index = series_index()
+    assert index.conflicts([], series=Series(week(50, minutes=30), frozenset())) == {1}
+    assert index.conflicts([], series=Series(week(50, minutes=60), frozenset())) == set()
+
+
+def test_exclude():
+    index = series_index(entries=[(week(2, days=1), 2)])
+    assert index.conflicts([week(2), week(2, days=1)]) == {1, 2}
+    assert index.conflicts([week(2), week(2, days=1)], exclude=1) == {2}
+    # Moving the series itself: neither its stored sessions nor its series count.
+    assert index.conflicts([week(20)], exclude=1) == set()
+    assert index.conflicts([], exclude=1, series=Series(FIRST, frozenset())) == set()
+    with pytest.raises(BookingConflict) as exc_info:
+        index.check([week(20)], exclude=2)
+    assert exc_info.value.booking_ids == {1}
+
+
+def test_without_a_horizon_every_session_is_checked_against_series():
+    index = IntervalIndex([], None, [(1, Series(FIRST, frozenset()))])
+    assert index.conflicts([week(1)]) == {1}
+
+
+def test_replace_and_remove():
+    index = series_index()
+    index.replace(2, [week(2, days=1)])
+    assert index.conflicts([week(2, days=1)]) == {2}
+    index.replace(2, [week(2, days=2)])
+    assert index.conflicts([week(2, days=1)]) == set()
+    index.remove(1)
+    assert index.conflicts([week(2), week(30)]) == set()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(occurrences, "_materialized_until", HORIZON)
+    engine = create_engine(f"sqlite:///{tmp_path / 'schedule.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Psychologist(id=1, name="Dr. Zoë"))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def random_booking(rnd: random.Random) -> Booking:
+    date_time = FIRST + timedelta(days=rnd.randrange(-70, 140), minutes=15 * rnd.randrange(96))
+    booking = Booking(psychologist_id=1, date_time=date_time, is_recurring=rnd.random() < 0.3)
+    if booking.is_recurring:
+        booking.exception_rows = [
+            BookingException(occurrence_date=date_time + timedelta(weeks=rnd.randrange(60), hours=rnd.randrange(-3, 4)))
+            for _ in range(rnd.randrange(4))
+        ]
+    return booking
+
+
+def test_load_index_matches_build_index(db):
+    rnd = random.Random(4)
+    for i in range(150):
+        booking = random_booking(rnd)
+        booking.client = Client(name=f"client {i}")
+        db.add(booking)
+        db.flush()
+        add_occurrences(db, booking)
+    db.commit()
+
+    full = build_index(db, 1, HORIZON)
+    for _ in range(300):
+        booking = random_booking(rnd)
+        starts = planned_sessions(booking)
+        series = booking_series(booking)
+        exclude = rnd.choice([None, rnd.randrange(1, 151)])
+        partial = load_index(db, 1, HORIZON, starts, series)
+        assert partial.conflicts(starts, exclude, series) == full.conflicts(starts, exclude, series)
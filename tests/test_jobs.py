@@ -0,0 +1,41 @@
+import json
+
+import fakeredis
+import pytest
+
+from utils.jobs import ACCEPTED, DONE, FAILED, RUNNING, JobStore
+
+
+@pytest.fixture
+def jobs():
+    return JobStore(fakeredis.FakeRedis())
+
+
+def test_claim_get_and_transitions(jobs):
+    assert jobs.get("k") is None
+    assert jobs.claim("k", "task-1") is None
+    # A second claim sees the first job instead of starting another one.
+    assert jobs.claim("k", "task-2") == (ACCEPTED, "task-1", None, None)
+
+    assert jobs.transition("k", RUNNING, 60) == RUNNING
+    result = json.dumps({"status": DONE, "key": "k"})
+    assert jobs.transition("k", DONE, 60, result=result) == DONE
+    assert jobs.get("k") == (DONE, "task-1", result.encode(), None)
+    # A late duplicate cannot overwrite the finished job.
+    assert jobs.transition("k", FAILED, 60, error="late") == DONE
+    assert jobs.claim("k", "task-3").state == DONE
+
+
+def test_failed_job_can_be_claimed_again(jobs):
+    jobs.claim("k", "task-1")
+    assert jobs.transition("k", FAILED, 60, error="boom") == FAILED
+    assert jobs.get("k").error == "boom"
+    assert jobs.claim("k", "task-2") is None
+    assert jobs.get("k") == (ACCEPTED, "task-2", None, None)
+
+
+def test_release_only_undoes_our_own_claim(jobs):
+    jobs.claim("k", "task-1")
+    assert not jobs.release("k", "task-2")
+    assert jobs.release("k", "task-1")
+    assert jobs.get("k") is None
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from database import Base
+from migrations import migrate_legacy_exceptions
+from models import Booking, BookingException, Client, Psychologist
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schedule.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_migrate_legacy_exceptions_twice(db):
+    db.add(Psychologist(id=1, name="Dr. Zoë"))
+    db.add_all([
+        Booking(
+            id=1, date_time=datetime(2030, 1, 7, 9), is_recurring=True, psychologist_id=1, client=Client(name="a"),
+            legacy_exceptions=["2030-01-22T10:00:00", "2030-02-05T11:00:00"],
+        ),
+        Booking(id=2, date_time=datetime(2030, 1, 8, 9), psychologist_id=1, client=Client(name="b")),
+        Booking(id=3, date_time=datetime(2030, 1, 9, 9), psychologist_id=1, client=Client(name="c")),
+    ])
+    db.commit()
+    # What earlier runs of the migration left behind: the JSON text 'null'.
+    db.execute(text("UPDATE booking SET exceptions = 'null' WHERE id = 3"))
+    db.commit()
+
+    assert migrate_legacy_exceptions(db) == 1
+    assert db.scalar(text("SELECT exceptions FROM booking WHERE id = 1")) is None
+    # Second startup: nothing left to migrate, and nothing duplicated.
+    assert migrate_legacy_exceptions(db) == 0
+    assert db.scalars(
+        select(BookingException.occurrence_date).order_by(BookingException.occurrence_date)
+    ).all() == [datetime(2030, 1, 22, 10), datetime(2030, 2, 5, 11)]
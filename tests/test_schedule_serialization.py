@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import Base
+from main import BookingSchema, load_schedule, render_schedule
+from models import Booking, BookingException, Client, Psychologist
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schedule.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def bookings(db):
+    db.add(Psychologist(id=1, name="Dr. Zoë"))
+    start = datetime(2030, 1, 7, 9)
+    rows = [
+        # Recurring series with rescheduled sessions
+        Booking(date_time=start, is_recurring=True, status="Approved", exception_rows=[
+            BookingException(occurrence_date=start + timedelta(weeks=2, days=1)),
+            BookingException(occurrence_date=start + timedelta(weeks=5, hours=3, microseconds=250)),
+        ]),
+        Booking(date_time=start + timedelta(days=1, microseconds=123456), status="Pending"),
+        Booking(date_time=start + timedelta(days=2, seconds=59, microseconds=1), is_recurring=True),
+        Booking(date_time=start + timedelta(days=3), status="Réservé ✓ 予約"),
+        Booking(date_time=start + timedelta(days=4), status='Quoted "\\ status\n'),
+    ]
+    for i, booking in enumerate(rows):
+        booking.psychologist_id = 1
+        booking.client = Client(name=f"Clïent {i} — 名前")
+        db.add(booking)
+    db.commit()
+    return rows
+
+
+def expected_json(db, limit=None) -> bytes:
+    """The body /schedule served before render_schedule: ORM objects through the TypeAdapter."""
+    orm_bookings = db.scalars(select(Booking).order_by(Booking.date_time, Booking.id).limit(limit)).all()
+    adapter = TypeAdapter(List[BookingSchema])
+    return adapter.dump_json(adapter.validate_python(orm_bookings, from_attributes=True))
+
+
+def test_render_schedule_matches_booking_schema(db, bookings):
+    rows, next_cursor = load_schedule(db, 1, None, None, None, None)
+
+    assert next_cursor is None
+    assert render_schedule(db, rows) == expected_json(db)
+
+
+def test_render_schedule_page_matches_booking_schema(db, bookings):
+    rows, next_cursor = load_schedule(db, 1, None, None, None, 3)
+
+    assert next_cursor is not None
+    assert render_schedule(db, rows) == expected_json(db, limit=3)
+
+
+def test_render_empty_schedule(db):
+    assert render_schedule(db, []) == b"[]"
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from utils.timestamps import parse_client_time, parse_timestamp, parse_timestamps
+
+UTC = timezone.utc
+
+
+def strptime_client_time(value: str, timezone_offset: int) -> datetime:
+    """What the endpoints did before utils.timestamps."""
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ') - timedelta(minutes=timezone_offset)
+
+
+def test_matches_strptime_on_random_iso_strings():
+    rnd = random.Random(20301)
+    for _ in range(20000):
+        dt = datetime(1990, 1, 1) + timedelta(seconds=rnd.randrange(2 * 10 ** 9), milliseconds=rnd.randrange(1000))
+        value = dt.isoformat(timespec="milliseconds") + "Z"  # Date.toISOString()
+        offset = rnd.randrange(-14 * 60, 12 * 60 + 1)
+        assert parse_client_time(value, offset) == strptime_client_time(value, offset), value
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2030-01-07T08:00:00.000Z", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+    ("2030-01-07T08:00:00z", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+    ("2030-01-07T08:00:00.1Z", datetime(2030, 1, 7, 8, 0, 0, 100000, tzinfo=UTC)),
+    ("2030-01-07T08:00:00.123456789Z", datetime(2030, 1, 7, 8, 0, 0, 123456, tzinfo=UTC)),
+    ("2030-01-07T08:00:00,5Z", datetime(2030, 1, 7, 8, 0, 0, 500000, tzinfo=UTC)),
+    ("2030-01-07T10:00:00+02:00", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+    ("2030-01-07T10:00:00+0200", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+    ("2030-01-07 03:00-05:00", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+    # No offset: taken as UTC
+    ("2030-01-07T08:00", datetime(2030, 1, 7, 8, tzinfo=UTC)),
+])
+def test_accepted_variants(value, expected):
+    parsed = parse_timestamp(value)
+    assert parsed == expected
+    assert parsed.tzinfo is UTC
+
+
+@pytest.mark.parametrize("value", [
+    "",
+    "2030-01-07",
+    "2030-W02-1T08:00",
+    "2030-W02-1",
+    "20300107T0800",
+    "20300107T080000Z",
+    "2030-01-07T08",
+    "2030-01-07T08:00:00.Z",
+    "2030-01-07T08:00:00Z ",
+    "2030-02-30T08:00:00Z",
+    "2030-01-07T24:00:00Z",
+    "2030-01-07T08:00:00+24:00",
+    "２０３０-01-07T08:00:00Z",
+    "not a timestamp",
+])
+def test_rejected_on_every_python_version(value):
+    with pytest.raises(ValueError, match="Invalid ISO 8601 timestamp"):
+        parse_timestamp(value)
+
+
+def test_parse_timestamps_batch():
+    assert parse_timestamps(["2030-01-07T08:00:00Z", "2030-01-07T10:00:00+02:00"]) == [
+        datetime(2030, 1, 7, 8, tzinfo=UTC),
+    ] * 2
+    with pytest.raises(ValueError):
+        parse_timestamps(["2030-01-07T08:00:00Z", "nope"])
+
+    parsed = parse_timestamps(["nope", "2030-01-07T08:00:00Z"], return_exceptions=True)
+    assert isinstance(parsed[0], ValueError)
+    assert parsed[1] == datetime(2030, 1, 7, 8, tzinfo=UTC)
+
+
+@pytest.mark.parametrize("method, url, body", [
+    ("POST", "/book", {"client_name": "a", "psychologist_id": 1, "date_time": "2030-W02-1", "timezoneOffset": 0}),
+    ("PUT", "/modify/1", {"newDateTime": "20300107T0800", "timezoneOffset": 0}),
+    ("PUT", "/add_exception/1/", {"exception_date": "tomorrow", "timezoneOffset": 0}),
+])
+def test_single_booking_endpoints_reject_bad_timestamps_with_422(method, url, body):
+    from main import app
+
+    response = TestClient(app).request(method, url, json=body)
+    assert response.status_code == 422
+    assert "Invalid ISO 8601 timestamp" in response.text
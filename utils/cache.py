@@ -0,0 +1,157 @@
+# utils/cache.py
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis
+import redis.asyncio
+
+from utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class VersionedCache:
+    """
+    Read-through cache in Redis with version-based invalidation.
+
+    Entries live under `{namespace}:{scope}:{version}:{key}`. Writers call
+    `invalidate(scope)`, which bumps the scope's version, so every cached
+    entry of that scope is orphaned in one INCR and simply expires later.
+
+    On a miss only one caller recomputes an entry (single-flight): it takes
+    a short NX lock, while concurrent callers wait for the entry to appear
+    instead of all hitting the database at once.
+
+    Redis is an optimisation here, never a dependency: if it is unreachable
+    the cache is bypassed for `retry_after` seconds and values are computed
+    directly.
+    """
+
+    def __init__(
+        self,
+        client: redis.asyncio.Redis,
+        namespace: str,
+        ttl: int = 300,
+        lock_ttl: int = 10,
+        wait_timeout: float = 2.0,
+        poll_interval: float = 0.05,
+        retry_after: float = 5.0,
+    ):
+        self.client = client
+        self.namespace = namespace
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self._down_until = 0.0
+
+    def _version_key(self, scope) -> str:
+        return f"{self.namespace}:version:{scope}"
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, exc: Exception) -> None:
+        self._down_until = time.monotonic() + self.retry_after
+        logger.warning(
+            "cache_unavailable",
+            extra={"cache": self.namespace, "error": str(exc)},
+        )
+
+    def _seed(self) -> int:
+        # Versions start from the current time rather than 0, so a version
+        # number is never reused if Redis loses its data (callers also use
+        # versions as ETags).
+        return time.time_ns() // 1000
+
+    async def version(self, scope) -> Optional[int]:
+        """Current version of `scope`, or None if Redis is unavailable."""
+        if not self._available():
+            return None
+        key = self._version_key(scope)
+        try:
+            version = await self.client.get(key)
+            if version is None:
+                await self.client.set(key, self._seed(), nx=True)
+                version = await self.client.get(key)
+            return int(version)
+        except redis.RedisError as exc:
+            self._mark_down(exc)
+            return None
+
+    async def invalidate(self, scope) -> None:
+        """Orphan every cached entry of `scope`. Call after the write commits."""
+        if not self._available():
+            return
+        key = self._version_key(scope)
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(key, self._seed(), nx=True)
+            pipe.incr(key)
+            await pipe.execute()
+        except redis.RedisError as exc:
+            self._mark_down(exc)
+
+    async def _store(self, entry_key: str, lock_key: str, entry: Dict[str, bytes]) -> None:
+        try:
+            pipe = self.client.pipeline()
+            pipe.hset(entry_key, mapping=entry)
+            pipe.expire(entry_key, self.ttl)
+            pipe.delete(lock_key)
+            await pipe.execute()
+        except redis.RedisError as exc:
+            self._mark_down(exc)
+
+    async def get_or_compute(
+        self,
+        scope,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, bytes]]],
+        version: Optional[int] = None,
+    ) -> Dict[str, bytes]:
+        """
+        Return the cached entry for `key`, computing and storing it on a miss.
+
+        An entry is a small dict of byte strings (e.g. a serialized body and
+        the headers that go with it), stored as a Redis hash. Pass `version`
+        if the caller has already read it.
+        """
+        if version is None:
+            version = await self.version(scope)
+        if version is None:
+            CACHE_REQUESTS.labels(self.namespace, "bypass").inc()
+            return await compute()
+
+        entry_key = f"{self.namespace}:{scope}:{version}:{key}"
+        lock_key = f"{entry_key}:lock"
+        try:
+            entry = await self.client.hgetall(entry_key)
+            if entry:
+                CACHE_REQUESTS.labels(self.namespace, "hit").inc()
+                return {k.decode(): v for k, v in entry.items()}
+
+            if await self.client.set(lock_key, "1", nx=True, ex=self.lock_ttl):
+                CACHE_REQUESTS.labels(self.namespace, "miss").inc()
+                try:
+                    entry = await compute()
+                except Exception:
+                    await self.client.delete(lock_key)
+                    raise
+                await self._store(entry_key, lock_key, entry)
+                return entry
+
+            # Someone else is recomputing this entry; wait for it.
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                entry = await self.client.hgetall(entry_key)
+                if entry:
+                    CACHE_REQUESTS.labels(self.namespace, "coalesced").inc()
+                    return {k.decode(): v for k, v in entry.items()}
+        except redis.RedisError as exc:
+            self._mark_down(exc)
+
+        CACHE_REQUESTS.labels(self.namespace, "bypass").inc()
+        return await compute()
@@ -0,0 +1,76 @@
+# utils/job_events.py
+"""
+Job status notifications over Redis pub/sub.
+
+The worker publishes an event on job:{key}:events whenever a job makes
+progress, finishes or fails; the API's long-poll and Server-Sent Events
+endpoints wait on those instead of polling Redis.
+
+Pub/sub delivers only to current subscribers, so readers subscribe *before*
+reading the job's state from its keys: an event published in between is
+then queued on the subscription rather than lost.
+"""
+import asyncio
+import json
+import time
+from typing import Optional
+
+import redis.asyncio
+
+# Events after which nothing more is published for a job
+TERMINAL_STATUSES = ("done", "failed")
+
+
+def job_channel(key: str) -> str:
+    return f"job:{key}:events"
+
+
+def publish_job_event(client, key: str, event: dict) -> None:
+    """
+    Publish `event` (a dict with a "status") for job `key`. `client` may be
+    a pipeline, to publish together with the writes it announces.
+    """
+    client.publish(job_channel(key), json.dumps(event))
+
+
+class JobSubscription:
+    """
+    Events of one job, as an async context manager:
+
+        async with JobSubscription(client, key) as events:
+            ...read the current state...
+            event = await events.next(timeout=30)
+    """
+
+    def __init__(self, client: redis.asyncio.Redis, key: str):
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.channel = job_channel(key)
+
+    async def __aenter__(self) -> "JobSubscription":
+        await self.pubsub.subscribe(self.channel)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        # Shielded so a cancelled request (client gone) still returns the
+        # connection to the pool.
+        await asyncio.shield(self.pubsub.aclose())
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """The next event, or None if there was none within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Returns None early for subscribe confirmations, hence the loop.
+            message = await self.pubsub.get_message(timeout=remaining)
+            if message is not None and message["type"] == "message":
+                return json.loads(message["data"])
+
+    async def wait_until_finished(self, timeout: float) -> Optional[dict]:
+        """The job's done or failed event, or None if it did not finish in time."""
+        deadline = time.monotonic() + timeout
+        while True:
+            event = await self.next(deadline - time.monotonic())
+            if event is None or event.get("status") in TERMINAL_STATUSES:
+                return event
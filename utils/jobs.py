@@ -0,0 +1,167 @@
+# utils/jobs.py
+"""
+Idempotent background jobs, one Redis hash per Idempotency-Key.
+
+job:{key} holds the job's state, its Celery task id and, once finished,
+its result (the JSON served by GET /jobs/{key}) or error:
+
+    (none) --claim--> accepted --start--> running --finish--> done
+                         |                   |
+                         +-------fail--------+----> failed --claim--> accepted
+
+Every state change is a Lua script, so it checks and writes in one atomic
+round trip: two requests with the same key can never both claim it, and a
+late or duplicate task cannot overwrite a finished job. A failed job keeps
+its error for pollers but can be claimed again, so a retry with the same
+key runs the job once more instead of waiting for the key to expire.
+"""
+from typing import NamedTuple, Optional
+
+import redis
+import redis.asyncio
+
+ACCEPTED = "accepted"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# States in which a job is still going to produce a result
+PENDING_STATES = (ACCEPTED, RUNNING)
+
+# How long a claimed job may stay accepted/running (e.g. its worker died)
+# before the key expires and can be claimed again
+PENDING_TTL = 3600
+
+# KEYS[1] job hash; ARGV[1] task id, ARGV[2] ttl
+# Returns {"claimed", task id} or the existing job's state, task_id, result, error.
+CLAIM_SCRIPT = """
+local job = redis.call('HMGET', KEYS[1], 'state', 'task_id', 'result', 'error')
+if job[1] and job[1] ~= 'failed' then
+    return job
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'state', 'accepted', 'task_id', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {'claimed', ARGV[1]}
+"""
+
+# KEYS[1] job hash; ARGV[1] task id
+# Undoes a claim whose task could not be enqueued. Returns 1 if released.
+RELEASE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') == 'accepted'
+        and redis.call('HGET', KEYS[1], 'task_id') == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] job hash; ARGV[1] new state, ARGV[2] ttl, ARGV[3..] field, value, ...
+# Returns the job's state afterwards (false if there is no job).
+TRANSITION_SCRIPT = """
+local allowed = {
+    running = {accepted = true, running = true},
+    done = {accepted = true, running = true, none = true},
+    failed = {accepted = true, running = true},
+}
+local state = redis.call('HGET', KEYS[1], 'state') or 'none'
+if not allowed[ARGV[1]][state] then
+    return state ~= 'none' and state
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[1])
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return ARGV[1]
+"""
+
+
+def job_key(key: str) -> str:
+    return f"job:{key}"
+
+
+class Job(NamedTuple):
+    state: str
+    task_id: Optional[str]
+    # The JSON body of a finished job, as stored
+    result: Optional[bytes]
+    error: Optional[str]
+
+    @classmethod
+    def from_reply(cls, reply) -> Optional["Job"]:
+        state, task_id, result, error = reply
+        if state is None:
+            return None
+        return cls(
+            state.decode(),
+            task_id.decode() if task_id is not None else None,
+            result,
+            error.decode() if error is not None else None,
+        )
+
+
+def _decode(value) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _claim_reply(reply) -> Optional[Job]:
+    """CLAIM_SCRIPT's reply: None if claimed, otherwise the existing job."""
+    if reply[0] == b"claimed":
+        return None
+    return Job.from_reply(reply)
+
+
+class JobStore:
+    """Jobs for blocking clients (the Celery worker and the Flask app)."""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._transition = client.register_script(TRANSITION_SCRIPT)
+
+    def get(self, key: str) -> Optional[Job]:
+        return Job.from_reply(self.client.hmget(job_key(key), "state", "task_id", "result", "error"))
+
+    def claim(self, key: str, task_id: str, ttl: int = PENDING_TTL) -> Optional[Job]:
+        """See AsyncJobStore.claim()."""
+        return _claim_reply(self._claim(keys=[job_key(key)], args=[task_id, ttl]))
+
+    def release(self, key: str, task_id: str) -> bool:
+        """Undo our claim (e.g. the task could not be enqueued)."""
+        return bool(self._release(keys=[job_key(key)], args=[task_id]))
+
+    def transition(self, key: str, state: str, ttl: int, client=None, **fields) -> Optional[str]:
+        """
+        Move job `key` to `state` if allowed from its current state, setting
+        `fields` and the key's TTL. Returns the state afterwards, or None if
+        there is no such job (only `done` creates one). With `client` (a
+        pipeline) the script is queued and its result comes from execute().
+        """
+        args = [state, ttl]
+        for field, value in fields.items():
+            args += [field, value]
+        return _decode(self._transition(keys=[job_key(key)], args=args, client=client))
+
+
+class AsyncJobStore:
+    """Claiming and reading jobs from the API's asyncio client."""
+
+    def __init__(self, client: redis.asyncio.Redis):
+        self.client = client
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    async def get(self, key: str) -> Optional[Job]:
+        return Job.from_reply(await self.client.hmget(job_key(key), "state", "task_id", "result", "error"))
+
+    async def claim(self, key: str, task_id: str, ttl: int = PENDING_TTL) -> Optional[Job]:
+        """
+        Claim `key` for a new job run by `task_id`. Returns None if claimed
+        (the caller must now enqueue the task), otherwise the existing job.
+        A failed job is claimed again.
+        """
+        return _claim_reply(await self._claim(keys=[job_key(key)], args=[task_id, ttl]))
+
+    async def release(self, key: str, task_id: str) -> bool:
+        """Undo our claim (e.g. the task could not be enqueued)."""
+        return bool(await self._release(keys=[job_key(key)], args=[task_id]))
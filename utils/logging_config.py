@@ -1,40 +1,129 @@
-import logging
-import logging.config
+"""
+Logging shared by the API and the Celery worker.
+
+Loggers only put records on a bounded in-memory queue (`DroppingQueueHandler`);
+a background `QueueListener` thread formats them as one JSON object per line
+and writes them out, so neither the event loop nor a task ever waits on
+formatting or I/O. When the queue is full, records are dropped and counted
+(`log_records_dropped_total`) instead of blocking the caller.
+"""
+import atexit
 import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
 
-class JsonFormatter(logging.Formatter):
-    """A very small JSON formatter without third-party libs."""
-    def format(self, record):
-        record_dict = record.__dict__.copy()
+from utils.metrics import LOG_RECORDS_DROPPED
 
-        # Remove non-serializable fields
-        record_dict.pop('args', None)
-        record_dict.pop('exc_info', None)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Records buffered between the loggers and the writer thread
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
 
-        return json.dumps(record_dict)
+# `extra` fields copied into the JSON line; anything else on the record is ignored.
+LOG_FIELDS = (
+    # HTTP requests
+    "request_id", "method", "path", "route", "status", "status_code", "client",
+    "latency_ms", "user_agent", "detail",
+    # SQL per request
+    "db_queries", "db_time_ms", "db_repeated", "statement", "repeats",
+    # Errors
+    "error", "error_type", "error_message", "stack_trace",
+    # Celery tasks
+    "task_id", "idem_key", "retries", "duration_ms", "rows_scanned", "chunk", "chunks",
+    "resumed",
+    # Cache
+    "cache",
+)
 
-LOGGING = {
-    "version": 1,
-    "disable_existing_loggers": False,
 
-    "formatters": {
-        "json": {
-            "()": JsonFormatter,
-        }
-    },
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: fixed base fields plus whitelisted extras."""
 
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "json",
+    def format(self, record: logging.LogRecord) -> str:
+        log_record = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
         }
-    },
+        fields = record.__dict__
+        for key in LOG_FIELDS:
+            if key in fields:
+                log_record[key] = fields[key]
+        if record.exc_info:
+            log_record["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(log_record, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, since they may change once we return.
+        # Formatting happens on the listener thread.
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_output: Optional[logging.Handler] = None
+
+
+def _start_listener() -> None:
+    global _listener
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_handler.queue, _output, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork() -> None:
+    # The listener thread does not survive fork (e.g. Celery's prefork pool),
+    # and the old queue's lock may have been held at fork time.
+    if _handler is not None:
+        _start_listener()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(level: str = LOG_LEVEL, stream: Optional[TextIO] = None) -> None:
+    """
+    Route the root logger through the queue. Safe to call more than once;
+    later calls only change the level.
+    """
+    global _handler, _output
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _handler is not None:
+        return
 
-    "root": {
-        "handlers": ["console"],
-        "level": "INFO",
-    }
-}
+    _output = logging.StreamHandler(stream)
+    _output.setFormatter(JsonFormatter())
+    _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _start_listener()
+    root.handlers[:] = [_handler]
 
-def setup_logging():
-    logging.config.dictConfig(LOGGING)
+    atexit.register(stop_logging)
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,351 @@
+# utils/metrics.py
+"""
+Prometheus metrics shared by the API and the Celery worker.
+
+Set PROMETHEUS_MULTIPROC_DIR (to an empty, writable directory) before the
+process starts to run in multiprocess mode, e.g. with several uvicorn
+workers or Celery's prefork pool; `render_metrics()` then aggregates the
+samples written by every process.
+
+The API and the Celery worker each need a directory of their own: both
+write the same metric names (SQL, Redis, cache), so sharing one would make
+the API's /metrics and the worker's exporter each report the sum of both,
+and a scrape of the two would count every sample twice.
+"""
+import os
+import re
+import time
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import redis
+import redis.asyncio
+import redis.asyncio.client
+import redis.client
+from prometheus_client import (
+    REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.routing import Match
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+# Opt-in: record the shape of every SQL statement per request, to report
+# repeated statements (N+1 queries) and send a Server-Timing header
+SQL_PROFILING = os.getenv("SQL_PROFILING", "").lower() in ("1", "true", "yes")
+# Warn when one request runs the same statement shape more than this many times
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
+
+# Histogram buckets for a web request, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10)
+# Buckets for single DB statements and Redis commands
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template, method and status code.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served, by route template.",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of single SQL statements, by operation.",
+    ["operation"],
+    buckets=FAST_BUCKETS,
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "SQL statements executed while serving one HTTP request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Total SQL statement time while serving one HTTP request.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections held by the pool, by state (checked_out, idle) and its configured size.",
+    ["pool", "state"],
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Redis round-trip latency by command (pipelines count as one).",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time by task name and final state.",
+    ["task", "state"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+CELERY_TASK_RETRIES = Counter(
+    "celery_task_retries_total",
+    "Celery task retries by task name.",
+    ["task"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Read-through cache lookups by outcome (hit, miss, coalesced, bypass).",
+    ["cache", "result"],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full.",
+)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """The registry to expose, aggregating all processes in multiprocess mode."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics() -> bytes:
+    """Exposition text for /metrics."""
+    return generate_latest(metrics_registry())
+
+
+# ---- Database ----
+
+# A bound parameter, in any of the DB-API styles our drivers use
+_PARAM = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_PARAM_LIST = re.compile(rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})+\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """
+    `statement` with parameter lists (IN (?, ?, ...)) and numbers collapsed,
+    so statements that differ only in how many ids they were sent compare
+    equal.
+    """
+    shape = _PARAM_LIST.sub("(?...)", _SPACE.sub(" ", statement.strip()))
+    return _NUMBER.sub("N", shape)
+
+
+class QueryStats:
+    """
+    SQL statement count and time of the current request, and with
+    `profile` how often each statement shape ran.
+    """
+
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self, profile: bool = False):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = StatementCounter() if profile else None
+
+    def duplicates(self) -> int:
+        """Executions of a statement shape beyond its first."""
+        return sum(n - 1 for n in self.shapes.values()) if self.shapes else 0
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Statement shapes run more than `threshold` times, most frequent first."""
+        if not self.shapes:
+            return []
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. db;dur=3.2;desc="7 queries, 2 repeated"."""
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries, {self.duplicates()} repeated"'
+
+
+# Set by PrometheusMiddleware for the duration of a request. The object is
+# mutated in place, so statements run in threadpools or greenlets (which get
+# a copy of the context) still add to it.
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    if operation not in ("select", "insert", "update", "delete"):
+        operation = "other"
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        if stats.shapes is not None:
+            stats.shapes[statement_shape(statement)] += 1
+
+
+def track_queries(engine) -> None:
+    """Time every statement sent through `engine` (a sync Engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.logging_name).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def track_pool(name: str, pool) -> None:
+    """
+    Report the connections `pool` holds. Callback gauges cannot be
+    aggregated across processes, so this does nothing in multiprocess mode.
+    """
+    if MULTIPROCESS:
+        return
+    POOL_CONNECTIONS.labels(name, "checked_out").set_function(pool.checkedout)
+    POOL_CONNECTIONS.labels(name, "idle").set_function(pool.checkedin)
+    POOL_CONNECTIONS.labels(name, "size").set_function(pool.size)
+
+
+# ---- Redis ----
+
+def _command_name(args) -> str:
+    name = args[0] if args else "unknown"
+    return (name.decode() if isinstance(name, bytes) else str(name)).upper()
+
+
+class TimedRedis(redis.Redis):
+    """redis.Redis recording the latency of every command."""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(_command_name(args)).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class TimedAsyncRedis(redis.asyncio.Redis):
+    """redis.asyncio.Redis recording the latency of every command."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(_command_name(args)).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TimedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class TimedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+# ---- HTTP ----
+
+def route_template(scope) -> str:
+    """
+    The path template of the route serving `scope` (e.g. /schedule/{psychologist_id}),
+    so label values stay bounded whatever ids appear in URLs.
+    """
+    app = scope.get("app")
+    partial = None
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            # Path matches but the method does not (a 405)
+            partial = route.path
+    return partial or "unmatched"
+
+
+class PrometheusMiddleware:
+    """
+    Pure ASGI middleware recording request latency, in-flight requests and
+    the SQL statements each request ran.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = 500
+        stats = QueryStats(profile=SQL_PROFILING)
+        token = current_query_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            in_flight.dec()
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+            current_query_stats.reset(token)
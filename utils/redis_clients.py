@@ -0,0 +1,59 @@
+# utils/redis_clients.py
+"""
+The Redis clients shared by every module of a process.
+
+`async_redis_client` is for the API's async handlers, so Redis round trips
+never block the event loop. `redis_client` is for blocking code: Celery
+tasks and the legacy Flask app. Both use a bounded BlockingConnectionPool,
+so a burst of requests waits briefly (REDIS_POOL_TIMEOUT) for a free
+connection instead of opening an unbounded number of them. Both record
+command latency (utils.metrics).
+
+Job event subscriptions (utils.job_events) hold a connection for as long
+as a client waits on a long-poll or event stream, so they get a pool of
+their own, `async_pubsub_client`, and cannot starve the handlers.
+
+Connections are opened lazily, on the first command. The sync pool resets
+itself after fork (Celery's prefork children); the async pool must only be
+used from one event loop.
+"""
+import os
+
+import redis
+import redis.asyncio
+
+from utils.metrics import TimedAsyncRedis, TimedRedis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Connections per pool, i.e. per process
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Seconds to wait for a free connection when the pool is exhausted
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "2"))
+# Seconds to wait for a reply; pub/sub waits use their own timeouts
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+# Connections idle for longer are PINGed before reuse
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+# Concurrent job event subscriptions per process
+REDIS_PUBSUB_MAX_CONNECTIONS = int(os.getenv("REDIS_PUBSUB_MAX_CONNECTIONS", "500"))
+
+POOL_OPTIONS = {
+    "max_connections": REDIS_MAX_CONNECTIONS,
+    "timeout": REDIS_POOL_TIMEOUT,
+    "socket_timeout": REDIS_SOCKET_TIMEOUT,
+    "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+    "socket_keepalive": True,
+    "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+}
+
+redis_client = TimedRedis(
+    connection_pool=redis.BlockingConnectionPool.from_url(REDIS_URL, **POOL_OPTIONS)
+)
+async_redis_client = TimedAsyncRedis(
+    connection_pool=redis.asyncio.BlockingConnectionPool.from_url(REDIS_URL, **POOL_OPTIONS)
+)
+async_pubsub_client = redis.asyncio.Redis(
+    connection_pool=redis.asyncio.BlockingConnectionPool.from_url(
+        REDIS_URL, **{**POOL_OPTIONS, "max_connections": REDIS_PUBSUB_MAX_CONNECTIONS}
+    )
+)
@@ -0,0 +1,121 @@
+# utils/result_store.py
+"""
+Storage for job results too large to keep in Redis.
+
+A result is stored as one gzip-compressed blob; Redis only keeps the small
+metadata dict returned by `save()`, as the result field of the job's
+job:{key} hash (utils.jobs). Stores are chosen by URL (RESULT_STORE_URL),
+so an object-storage backend can be added next to the local-disk one
+without touching the callers.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO
+from urllib.parse import urlparse
+
+
+class ResultStore(ABC):
+    """Interface of a result store."""
+
+    @abstractmethod
+    def save(self, key: str, body: bytes) -> dict:
+        """Store `body` under `key`; returns metadata describing the blob."""
+
+    @abstractmethod
+    def open(self, key: str, decompress: bool = False) -> BinaryIO:
+        """
+        The stored blob, gzip-compressed as stored or decompressed on the
+        fly (still seekable). Raises FileNotFoundError if it is gone.
+        """
+
+    @abstractmethod
+    def purge(self, max_age: float) -> int:
+        """Delete blobs older than `max_age` seconds; returns how many."""
+
+
+class LocalResultStore(ResultStore):
+    """
+    Blobs in a local directory, shared by the API and the worker (e.g. a
+    mounted volume). Also the stand-in for object storage in development.
+    """
+
+    SUFFIX = ".json.gz"
+
+    def __init__(self, root: str, compresslevel: int = 6):
+        self.root = root
+        self.compresslevel = compresslevel
+        # The directory is created by the first save(), not at import time.
+        self._root_exists = False
+
+    def _path(self, key: str) -> str:
+        # Keys come from clients (Idempotency-Key); never use them as paths.
+        return os.path.join(self.root, hashlib.sha256(key.encode()).hexdigest() + self.SUFFIX)
+
+    def save(self, key: str, body: bytes) -> dict:
+        if not self._root_exists:
+            os.makedirs(self.root, exist_ok=True)
+            self._root_exists = True
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        digest = hashlib.blake2s(digest_size=8)
+        try:
+            with os.fdopen(fd, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self.compresslevel, mtime=0) as gz:
+                    gz.write(body)
+            with open(tmp_path, "rb") as blob:
+                for block in iter(lambda: blob.read(1 << 16), b""):
+                    digest.update(block)
+            stored_size = os.path.getsize(tmp_path)
+            # Readers never see a half-written blob.
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return {
+            "size": len(body),
+            "stored_size": stored_size,
+            "encoding": "gzip",
+            "digest": digest.hexdigest(),
+        }
+
+    def open(self, key: str, decompress: bool = False) -> BinaryIO:
+        if decompress:
+            return gzip.open(self._path(key), "rb")
+        return open(self._path(key), "rb")
+
+    def purge(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        purged = 0
+        if not os.path.isdir(self.root):
+            return purged
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.SUFFIX) and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.unlink(entry.path)
+                        purged += 1
+                    except FileNotFoundError:
+                        pass
+        return purged
+
+
+def store_from_url(url: str) -> ResultStore:
+    """A store for `url`: a directory path or file: URL for LocalResultStore."""
+    parsed = urlparse(url)
+    if parsed.scheme in ("", "file"):
+        return LocalResultStore(parsed.path or url)
+    raise ValueError(f"Unsupported result store URL: {url}")
+
+
+# Where finished job results live, shared by the API and the worker
+RESULT_STORE_URL = os.getenv("RESULT_STORE_URL", "results")
+# Results up to this size (serialized) stay inline in the job hash
+RESULT_INLINE_MAX_BYTES = int(os.getenv("RESULT_INLINE_MAX_BYTES", str(64 * 1024)))
+# How long results are kept, both the finished job hash and the blobs
+RESULT_TTL = 3600
+
+result_store = store_from_url(RESULT_STORE_URL)
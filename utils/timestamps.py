@@ -0,0 +1,106 @@
+# utils/timestamps.py
+"""
+Timestamp parsing shared by the API and the legacy Flask app.
+
+Clients send ISO 8601 strings (the frontend sends Date.toISOString(),
+e.g. 2030-01-07T08:00:00.000Z) together with their timezoneOffset in
+minutes (Date.getTimezoneOffset()). Timestamps are parsed into aware UTC
+datetimes first. Bookings are then stored as the client's wall-clock time:
+naive, UTC minus the offset. The rest of the code, and the rows already in
+the database, use that convention.
+
+The accepted grammar is the regex below, on every Python version:
+YYYY-MM-DD, "T" or a space, HH:MM, optional :SS with a 1-9 digit fraction,
+then Z, an offset (+HH:MM or +HHMM) or nothing. `datetime.fromisoformat`
+accepts more on Python 3.11+ (week dates, basic format), so it only sees
+strings that matched. It is the fast path: before 3.11 it rejects a Z,
+fractions that are not 3 or 6 digits and offsets without a colon, and those
+are built from the regex groups instead.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Union
+
+_ISO_8601 = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})"
+    r"(?::(\d{2})(?:[.,](\d{1,9}))?)?"
+    r"(?:([Zz])|([+-])(\d{2}):?(\d{2}))?",
+    re.ASCII,
+)
+
+
+def _invalid(value: str) -> ValueError:
+    return ValueError(f"Invalid ISO 8601 timestamp: {value!r}")
+
+
+def _from_groups(match: "re.Match[str]", value: str) -> datetime:
+    year, month, day, hour, minute, second, fraction, zulu, sign, off_h, off_m = match.groups()
+    try:
+        tzinfo = None
+        if zulu:
+            tzinfo = timezone.utc
+        elif sign:
+            offset = timedelta(hours=int(off_h), minutes=int(off_m))
+            tzinfo = timezone(-offset if sign == "-" else offset)
+        return datetime(
+            int(year), int(month), int(day), int(hour), int(minute), int(second or 0),
+            # Nanoseconds are truncated to microseconds.
+            int(fraction[:6].ljust(6, "0")) if fraction else 0,
+            tzinfo,
+        )
+    except ValueError:
+        raise _invalid(value) from None
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    An ISO 8601 timestamp as an aware UTC datetime. Timestamps without an
+    offset are taken to be UTC. Raises ValueError if `value` is not one.
+    """
+    match = _ISO_8601.fullmatch(value)
+    if match is None:
+        raise _invalid(value)
+    try:
+        dt = datetime.fromisoformat(value[:-1] + "+00:00" if match.group(8) else value)
+    except ValueError:
+        dt = _from_groups(match, value)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    # fromisoformat() gives the timezone.utc singleton for Z and +00:00.
+    if dt.tzinfo is timezone.utc:
+        return dt
+    return dt.astimezone(timezone.utc)
+
+
+def parse_timestamps(
+    values: Iterable[str], return_exceptions: bool = False
+) -> List[Union[datetime, ValueError]]:
+    """
+    parse_timestamp() over a bulk payload. With `return_exceptions`, an
+    invalid value gives its ValueError in place of a datetime instead of
+    failing the whole batch.
+    """
+    parse = parse_timestamp
+    if not return_exceptions:
+        return [parse(value) for value in values]
+    parsed = []
+    append = parsed.append
+    for value in values:
+        try:
+            append(parse(value))
+        except ValueError as exc:
+            append(exc)
+    return parsed
+
+
+def to_client_time(timestamp: datetime, timezone_offset: int) -> datetime:
+    """
+    The stored (naive) form of aware `timestamp`, sent by a client whose
+    Date.getTimezoneOffset() is `timezone_offset` minutes.
+    """
+    return (timestamp - timedelta(minutes=timezone_offset)).replace(tzinfo=None)
+
+
+def parse_client_time(value: str, timezone_offset: int) -> datetime:
+    """to_client_time() of timestamp string `value`."""
+    return to_client_time(parse_timestamp(value), timezone_offset)